@@ -0,0 +1,329 @@
+import asyncio
+import dataclasses
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+import httpx
+
+import tracing
+from circuit_breaker import CircuitBreaker
+from latency import LatencyTracker
+from metrics import Counter, Gauge, Histogram
+from negative_cache import NegativeCache
+from netwarm import DNSCache, cached_transport
+from routing import BlockRouter
+
+logger = logging.getLogger(__name__)
+
+ADSGRAM_BASE_URL = "https://adsgram.ai/api"
+
+# Ad fetch outcomes
+FILLED = "filled"
+NO_FILL = "no_fill"
+HTTP_ERROR = "http_error"
+EXCEPTION = "exception"
+CIRCUIT_OPEN = "circuit_open"
+# Attempt abandoned before AdsGram answered (a discarded prefetch, shutdown)
+CANCELLED = "cancelled"
+
+ADSGRAM_TIMEOUT_SECONDS = Gauge(
+    "adsgram_timeout_seconds",
+    "Current adaptive AdsGram timeout by phase (connect, read)",
+    ("phase",),
+)
+ADSGRAM_LATENCY_QUANTILE = Gauge(
+    "adsgram_latency_quantile_seconds",
+    "Rolling AdsGram latency percentiles",
+    ("quantile",),
+)
+ADSGRAM_REQUEST_SECONDS = Histogram(
+    "adsgram_request_duration_seconds",
+    "AdsGram HTTP request latency by response status (\"error\" when no response arrived)",
+    ("status",),
+)
+ADSGRAM_FETCHES = Counter(
+    "adsgram_fetches_total",
+    "Ad fetches by final outcome (filled, no_fill, http_error, exception, circuit_open)",
+    ("outcome",),
+)
+ADSGRAM_HEDGES = Counter(
+    "adsgram_hedges_total",
+    "Hedged AdsGram requests (sent, won, skipped when the hedge budget was spent)",
+    ("result",),
+)
+
+
+class HedgeBudget:
+    """Token bucket that caps hedged requests at a fraction of primary requests."""
+
+    def __init__(self, ratio: float = 0.1, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def earn(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+@dataclass
+class AdResult:
+    outcome: str
+    block_id: Optional[str] = None
+    url: Optional[str] = None
+    status_code: Optional[int] = None
+    body: str = ""
+    error: Optional[BaseException] = None
+    latency: float = 0.0
+    cached: bool = False
+
+
+class AdsGramClient:
+    """Async AdsGram client backed by a persistent keep-alive connection pool.
+
+    Requests go to the block picked by the router and fail over to the next
+    block when one has no ad. Connect and read timeouts follow the rolling p50/p99 of observed latency,
+    clamped to [min_timeout, timeout]. With hedging on, a request that has not
+    answered by about p95 gets a duplicate, within the hedge budget.
+    ``on_attempt(telegram_id, result)`` is called for every block tried,
+    including failovers and fetches whose result is never shown, with that
+    block's own outcome and latency.
+    """
+
+    def __init__(
+        self,
+        block_ids: Sequence[str],
+        *,
+        base_url: str = ADSGRAM_BASE_URL,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 10.0,
+        min_timeout: float = 0.5,
+        timeout_multiplier: float = 2.0,
+        min_samples: int = 20,
+        hedge: bool = False,
+        hedge_budget: float = 0.1,
+        hedge_min_delay: float = 0.05,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        negative_cache: Optional[NegativeCache] = None,
+        dns_cache: Optional[DNSCache] = None,
+        on_attempt: Optional[Callable[[int, AdResult], None]] = None,
+    ):
+        self.router = BlockRouter(block_ids)
+        self.base_url = base_url.rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.min_timeout = min(min_timeout, timeout)
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.hedge = hedge
+        self.hedge_budget = HedgeBudget(hedge_budget)
+        self.hedge_min_delay = hedge_min_delay
+        self.transport = transport
+        self.breaker = breaker
+        self.negative_cache = negative_cache
+        self.dns_cache = dns_cache
+        self.on_attempt = on_attempt
+        self.latency = LatencyTracker()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self._client is None:
+            transport = self.transport
+            if transport is None and self.dns_cache is not None:
+                transport = cached_transport(self.dns_cache, limits=self.limits)
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=transport,
+            )
+            logger.info(
+                "AdsGram client started (%s, max_connections=%s, max_keepalive=%s, hedge=%s)",
+                self.base_url,
+                self.limits.max_connections,
+                self.limits.max_keepalive_connections,
+                self.hedge,
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("AdsGram client closed")
+
+    async def warm(self, connections: int = 1):
+        """Open (or refresh) ``connections`` pooled keep-alive connections with cheap HEAD requests."""
+        if self._client is None:
+            raise RuntimeError("AdsGram client is not started")
+        # Concurrent requests can't share a connection, so each one keeps a separate socket warm
+        await asyncio.gather(*(self._client.head("") for _ in range(connections)))
+
+    def ad_path(self, block_id: str) -> str:
+        return f"/blocks/{block_id}/start"
+
+    def current_timeout(self) -> httpx.Timeout:
+        # Stay at the configured ceiling until there is enough history
+        if self.latency.count < self.min_samples:
+            return httpx.Timeout(self.timeout)
+
+        def clamp(value: float) -> float:
+            return max(self.min_timeout, min(self.timeout, value))
+
+        read = clamp(self.latency.p99 * self.timeout_multiplier)
+        connect = clamp(self.latency.p50 * self.timeout_multiplier)
+        return httpx.Timeout(read, connect=connect, pool=connect)
+
+    async def fetch_ad(self, telegram_id: int) -> AdResult:
+        if self._client is None:
+            raise RuntimeError("AdsGram client is not started")
+
+        started = time.perf_counter()
+        previous = None
+        for index in self.router.order():
+            if previous is not None:
+                self.router.record_failover(previous)
+            result = await self._fetch_block(index, telegram_id)
+            if result.outcome != NO_FILL:
+                break
+            previous = index
+
+        # The attempt's own result may already be queued for the audit log; don't change it
+        result = dataclasses.replace(result, latency=time.perf_counter() - started)
+        ADSGRAM_FETCHES.labels(result.outcome).inc()
+        return result
+
+    async def _fetch_block(self, index: int, telegram_id: int) -> AdResult:
+        started = time.perf_counter()
+        try:
+            result = await self._try_block(index, telegram_id)
+        except asyncio.CancelledError:
+            if self.on_attempt is not None:
+                block_id, latency = self.router.block_ids[index], time.perf_counter() - started
+                self.on_attempt(telegram_id, AdResult(CANCELLED, block_id=block_id, latency=latency))
+            raise
+        if self.on_attempt is not None:
+            self.on_attempt(telegram_id, result)
+        return result
+
+    async def _try_block(self, index: int, telegram_id: int) -> AdResult:
+        block_id = self.router.block_ids[index]
+
+        # Recently empty for this user (or the whole block): don't ask again yet
+        if self.negative_cache is not None and self.negative_cache.is_empty(block_id, telegram_id):
+            return AdResult(NO_FILL, block_id=block_id, cached=True)
+
+        # Fail fast while AdsGram is known to be unhealthy
+        if self.breaker is not None and not self.breaker.allow():
+            return AdResult(CIRCUIT_OPEN, block_id=block_id)
+
+        timeout = self.current_timeout()
+        started = time.perf_counter()
+        try:
+            if self.hedge:
+                result = await self._hedged_request(block_id, telegram_id, timeout)
+            else:
+                result = await self._request(block_id, telegram_id, timeout)
+        except asyncio.CancelledError:
+            if self.breaker is not None:
+                self.breaker.release()
+            raise
+
+        result.block_id = block_id
+        result.latency = time.perf_counter() - started
+        failed = result.outcome in (HTTP_ERROR, EXCEPTION)
+        # Timeouts are observed too, so a slower AdsGram widens the timeouts again
+        self._observe(result.latency)
+        self.router.record(index, result.outcome == FILLED, failed, result.latency)
+        if self.breaker is not None:
+            self.breaker.record(failed, result.latency)
+        if self.negative_cache is not None:
+            if result.outcome == NO_FILL:
+                self.negative_cache.record_no_fill(block_id, telegram_id)
+            elif result.outcome == FILLED:
+                self.negative_cache.record_fill(block_id, telegram_id)
+        return result
+
+    async def _request(self, block_id: str, telegram_id: int, timeout: httpx.Timeout) -> AdResult:
+        with tracing.span("adsgram.start", tracing.CLIENT, peer="adsgram", block=block_id) as span:
+            result = await self._get(block_id, telegram_id, timeout)
+            if span is not None:
+                span.set_tag("outcome", result.outcome)
+                if result.status_code is not None:
+                    span.set_tag("http.status_code", result.status_code)
+            return result
+
+    async def _get(self, block_id: str, telegram_id: int, timeout: httpx.Timeout) -> AdResult:
+        started = time.perf_counter()
+        try:
+            try:
+                response = await self._client.get(
+                    self.ad_path(block_id), params={"telegram_id": telegram_id}, timeout=timeout
+                )
+            except Exception:
+                ADSGRAM_REQUEST_SECONDS.labels("error").observe(time.perf_counter() - started)
+                raise
+            ADSGRAM_REQUEST_SECONDS.labels(response.status_code).observe(time.perf_counter() - started)
+            if response.status_code != 200:
+                return AdResult(HTTP_ERROR, status_code=response.status_code, body=response.text)
+            data = response.json()
+            if "url" in data:
+                return AdResult(FILLED, url=data["url"], status_code=200)
+            return AdResult(NO_FILL, status_code=200)
+        except Exception as e:
+            return AdResult(EXCEPTION, error=e)
+
+    async def _hedged_request(self, block_id: str, telegram_id: int, timeout: httpx.Timeout) -> AdResult:
+        self.hedge_budget.earn()
+        primary = asyncio.create_task(self._request(block_id, telegram_id, timeout))
+        pending = {primary}
+        try:
+            delay = max(self.hedge_min_delay, self.latency.p95)
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            if not self.hedge_budget.spend():
+                ADSGRAM_HEDGES.labels("skipped").inc()
+                return await primary
+
+            ADSGRAM_HEDGES.labels("sent").inc()
+            hedge = asyncio.create_task(self._request(block_id, telegram_id, timeout))
+            pending.add(hedge)
+
+            # Take the first usable answer; fall back to whichever failed last
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result.outcome in (FILLED, NO_FILL):
+                        if task is hedge:
+                            ADSGRAM_HEDGES.labels("won").inc()
+                        return result
+                if not pending:
+                    return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _observe(self, latency: float):
+        if self.latency.observe(latency):
+            ADSGRAM_LATENCY_QUANTILE.labels("0.5").set(self.latency.p50)
+            ADSGRAM_LATENCY_QUANTILE.labels("0.95").set(self.latency.p95)
+            ADSGRAM_LATENCY_QUANTILE.labels("0.99").set(self.latency.p99)
+            timeout = self.current_timeout()
+            ADSGRAM_TIMEOUT_SECONDS.labels("connect").set(timeout.connect)
+            ADSGRAM_TIMEOUT_SECONDS.labels("read").set(timeout.read)
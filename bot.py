@@ -1,16 +1,45 @@
+import asyncio
+import functools
 import os
 import logging
-import requests
+import secrets
+import threading
+import time
+from typing import Optional
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.constants import ParseMode
+from telegram.request import BaseRequest
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
+    filters,
 )
 
+from adsgram import AdResult, AdsGramClient, CIRCUIT_OPEN, EXCEPTION, FILLED, NO_FILL, HTTP_ERROR
+from circuit_breaker import CircuitBreaker
+from dispatch import LaneApplication
+from eventlog import EventLog
+from health import HealthMonitor, HeartbeatRequest, add_health_routes
+from http_server import HTTPServer
+from logpipe import configure_logging, truncate
+from loopwatch import LoopMonitor
+from metrics import Histogram, add_metrics_route, timed
+from negative_cache import NegativeCache
+from persistence import BotData, SQLitePersistence
+from netwarm import DNSCache, KeepWarm, WarmHTTPXRequest
+from ratelimit import FloodLimiter
+from prefetch import Prefetcher
+from profiler import SamplingProfiler, profile_to_file
+from singleflight import SingleFlight
+from stats import RollingStats
+from tracing import FileExporter, Tracer, ZipkinExporter, set_tracer
+from users import UserRegistry
+from userstate import UserStateTable
+from webhook import add_webhook_route, run_webhook
+
 # Load local .env (only used locally, not on Render)
 load_dotenv()
 
@@ -23,16 +52,177 @@ if not BOT_TOKEN:
 if not BLOCK_ID:
     raise RuntimeError("❌ Missing BLOCK_ID env var. Set it in .env (local) or Render Dashboard (production).")
 
-# Logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
+# Logging: JSON lines (or LOG_FORMAT=text) written from a background thread, rate limited per message
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_RATE_BURST = int(os.getenv("LOG_RATE_BURST", "20"))
+LOG_RATE_INTERVAL = float(os.getenv("LOG_RATE_INTERVAL", "60"))
+# AdsGram error bodies in log lines are cut to this many characters
+LOG_MAX_FIELD = int(os.getenv("LOG_MAX_FIELD", "500"))
+
+configure_logging(
+    level=LOG_LEVEL,
+    fmt=LOG_FORMAT,
+    queue_size=LOG_QUEUE_SIZE,
+    burst=LOG_RATE_BURST,
+    interval=LOG_RATE_INTERVAL,
 )
+# httpx logs every request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# BLOCK_ID may list several AdsGram blocks separated by commas
+BLOCK_IDS = [block_id.strip() for block_id in BLOCK_ID.split(",") if block_id.strip()]
+
+# Bot API location (point it at tools/fake_telegram.py for offline runs)
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+
+# Update delivery: "polling" (default) or "webhook" served on $PORT
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+PORT = int(os.getenv("PORT", "8080"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", os.getenv("RENDER_EXTERNAL_URL", ""))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise RuntimeError(f"❌ Unknown BOT_MODE {BOT_MODE!r}. Use 'polling' or 'webhook'.")
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise RuntimeError("❌ Missing WEBHOOK_URL env var (required when BOT_MODE=webhook).")
+
+# Concurrent update processing on per-user lanes
+BOT_CONCURRENCY = int(os.getenv("BOT_CONCURRENCY", "32"))
+BOT_LANE_QUEUE_SIZE = int(os.getenv("BOT_LANE_QUEUE_SIZE", "1000"))
+
+# Outbound Bot API flood limits (requests per second)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+# Taps on an already answered show_ads message within this window are dropped
+SHOW_ADS_DEDUP_SECONDS = float(os.getenv("SHOW_ADS_DEDUP_SECONDS", "5"))
+
+# AdsGram API location (point it at tools/fake_adsgram.py for offline runs)
+ADSGRAM_BASE_URL = os.getenv("ADSGRAM_BASE_URL", "https://adsgram.ai/api")
+
+# AdsGram connection pool
+ADSGRAM_MAX_CONNECTIONS = int(os.getenv("ADSGRAM_MAX_CONNECTIONS", "100"))
+ADSGRAM_MAX_KEEPALIVE = int(os.getenv("ADSGRAM_MAX_KEEPALIVE", "20"))
+ADSGRAM_KEEPALIVE_EXPIRY = float(os.getenv("ADSGRAM_KEEPALIVE_EXPIRY", "30"))
+
+# Adaptive timeouts derived from rolling AdsGram latency, capped at ADSGRAM_TIMEOUT
+ADSGRAM_TIMEOUT = float(os.getenv("ADSGRAM_TIMEOUT", "10"))
+ADSGRAM_MIN_TIMEOUT = float(os.getenv("ADSGRAM_MIN_TIMEOUT", "0.5"))
+ADSGRAM_TIMEOUT_MULTIPLIER = float(os.getenv("ADSGRAM_TIMEOUT_MULTIPLIER", "2"))
+
+# Hedged AdsGram requests (opt-in), limited to a fraction of primary requests
+ADSGRAM_HEDGE = os.getenv("ADSGRAM_HEDGE", "0") == "1"
+ADSGRAM_HEDGE_BUDGET = float(os.getenv("ADSGRAM_HEDGE_BUDGET", "0.1"))
+
+# AdsGram circuit breaker
+ADSGRAM_BREAKER_WINDOW = int(os.getenv("ADSGRAM_BREAKER_WINDOW", "50"))
+ADSGRAM_BREAKER_MIN_CALLS = int(os.getenv("ADSGRAM_BREAKER_MIN_CALLS", "10"))
+ADSGRAM_BREAKER_FAILURE_RATE = float(os.getenv("ADSGRAM_BREAKER_FAILURE_RATE", "0.5"))
+ADSGRAM_BREAKER_SLOW_CALL = float(os.getenv("ADSGRAM_BREAKER_SLOW_CALL", "3"))
+ADSGRAM_BREAKER_SLOW_RATE = float(os.getenv("ADSGRAM_BREAKER_SLOW_RATE", "0.8"))
+ADSGRAM_BREAKER_OPEN_SECONDS = float(os.getenv("ADSGRAM_BREAKER_OPEN_SECONDS", "15"))
+ADSGRAM_BREAKER_PROBES = int(os.getenv("ADSGRAM_BREAKER_PROBES", "3"))
+
+# Negative cache for "no ads available" answers
+ADS_NO_FILL_TTL = float(os.getenv("ADS_NO_FILL_TTL", "10"))
+ADS_NO_FILL_MAX_ENTRIES = int(os.getenv("ADS_NO_FILL_MAX_ENTRIES", "50000"))
+ADS_BLOCK_EXHAUST_THRESHOLD = int(os.getenv("ADS_BLOCK_EXHAUST_THRESHOLD", "20"))
+ADS_BLOCK_EXHAUST_WINDOW = float(os.getenv("ADS_BLOCK_EXHAUST_WINDOW", "5"))
+ADS_BLOCK_EXHAUST_SECONDS = float(os.getenv("ADS_BLOCK_EXHAUST_SECONDS", "5"))
+
+# Speculative ad prefetch on /start (opt-in)
+ADS_PREFETCH = os.getenv("ADS_PREFETCH", "0") == "1"
+ADS_PREFETCH_TTL = float(os.getenv("ADS_PREFETCH_TTL", "30"))
+ADS_PREFETCH_MAX_ENTRIES = int(os.getenv("ADS_PREFETCH_MAX_ENTRIES", "10000"))
+
+# Prometheus metrics on their own listener, local-only by default ($PORT is public on Render);
+# an empty METRICS_PATH disables it
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))
+
+# Tracing: spans go to TRACE_FILE (Zipkin JSON lines) or a Zipkin collector at TRACE_ZIPKIN_URL.
+# A trace is kept when sampled or when the update took at least TRACE_SLOW_SECONDS.
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_ZIPKIN_URL = os.getenv("TRACE_ZIPKIN_URL", "")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "2"))
+
+# Startup warm-up: cached DNS, pre-opened keep-alive connections and periodic pings.
+# Keep WARM_PING_INTERVAL below both keep-alive expiries so idle pools never go cold.
+DNS_CACHE_TTL = float(os.getenv("DNS_CACHE_TTL", "300"))
+ADSGRAM_WARM_CONNECTIONS = int(os.getenv("ADSGRAM_WARM_CONNECTIONS", "4"))
+TELEGRAM_WARM_CONNECTIONS = int(os.getenv("TELEGRAM_WARM_CONNECTIONS", "2"))
+TELEGRAM_KEEPALIVE_EXPIRY = float(os.getenv("TELEGRAM_KEEPALIVE_EXPIRY", "60"))
+WARM_PING_INTERVAL = float(os.getenv("WARM_PING_INTERVAL", "20"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+
+# User registry: sightings are buffered in memory and written to SQLite (WAL) in batches
+USERS_DB = os.getenv("USERS_DB", "users.db")
+USERS_FLUSH_INTERVAL = float(os.getenv("USERS_FLUSH_INTERVAL", "5"))
+USERS_FLUSH_SIZE = int(os.getenv("USERS_FLUSH_SIZE", "5000"))
+USERS_MAX_PENDING = int(os.getenv("USERS_MAX_PENDING", "100000"))
+
+# Ad request audit log: rolling segments in EVENTS_DIR, compacted to columnar .evc files; empty disables it
+EVENTS_DIR = os.getenv("EVENTS_DIR", "events")
+EVENTS_BUFFER = int(os.getenv("EVENTS_BUFFER", "65536"))
+EVENTS_FLUSH_INTERVAL = float(os.getenv("EVENTS_FLUSH_INTERVAL", "1"))
+EVENTS_SEGMENT_BYTES = int(os.getenv("EVENTS_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+EVENTS_SEGMENT_SECONDS = float(os.getenv("EVENTS_SEGMENT_SECONDS", "3600"))
+
+# user_data/chat_data/bot_data persistence in SQLite, written every PERSISTENCE_INTERVAL seconds; empty disables it
+PERSISTENCE_DB = os.getenv("PERSISTENCE_DB", "")
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "60"))
+
+# /stats: rolling windows in seconds, each split into STATS_BUCKETS fixed-width slots
+STATS_WINDOWS = [float(span) for span in os.getenv("STATS_WINDOWS", "300,3600,86400").split(",") if span.strip()]
+STATS_BUCKETS = int(os.getenv("STATS_BUCKETS", "60"))
+
+# /healthz and /readyz on the bot's HTTP server
+HEALTH_MAX_LOOP_LAG = float(os.getenv("HEALTH_MAX_LOOP_LAG", "1"))
+HEALTH_MAX_POLL_AGE = float(os.getenv("HEALTH_MAX_POLL_AGE", "120"))
+
+# Admin-only commands (/profile, /stats) are limited to these Telegram user ids
+ADMIN_IDS = [int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()]
+
+# /profile: folded stacks are written to PROFILE_DIR
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+
+# Event-loop lag monitor; LOOP_DEBUG=1 also flags blocking calls made from handlers
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.25"))
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "0") == "1"
+
+HANDLER_SECONDS = Histogram("bot_handler_duration_seconds", "Update handler latency", ("handler",))
+
+
+# Note the user in the registry; only touches memory
+def remember_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if user is not None:
+        context.bot_data["users"].record(user.id, user.language_code)
+
 
 # Start command
+@timed(HANDLER_SECONDS.labels("start"))
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    remember_user(update, context)
+    state = context.bot_data["user_state"]
+    state.incr(update.effective_user.id, "starts")
+    state.set(update.effective_user.id, "last_start", int(time.time()))
+    prefetcher = context.bot_data.get("prefetcher")
+    if prefetcher is not None:
+        prefetcher.prefetch(update.effective_user.id)
+
     keyboard = [[InlineKeyboardButton("🎯 Show Ads", callback_data="show_ads")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text(
@@ -40,39 +230,315 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+# Serve a prefetched ad when there is a fresh one, otherwise fetch it live
+async def get_ad(context: ContextTypes.DEFAULT_TYPE, telegram_id: int) -> AdResult:
+    prefetcher = context.bot_data.get("prefetcher")
+    if prefetcher is not None:
+        result = await prefetcher.take(telegram_id)
+        if result is not None:
+            return result
+    return await context.bot_data["adsgram"].fetch_ad(telegram_id)
+
+
+# Every block AdsGram is asked for: its /stats line and the audit log (AdsGramClient.on_attempt)
+def record_attempt(bot_data: dict, telegram_id: int, result: AdResult):
+    bot_data["stats"].record_attempt(result)
+    events = bot_data.get("events")
+    if events is not None:
+        events.log_ad(telegram_id, result)
+
+
+# Fetch an ad and show it in place of the welcome message
+async def show_ad(query, context: ContextTypes.DEFAULT_TYPE):
+    result = None
+    try:
+        result = await get_ad(context, query.from_user.id)
+        # What the user is shown; the attempts behind it were recorded as they happened
+        context.bot_data["stats"].record(result)
+
+        if result.outcome == FILLED:
+            await query.edit_message_text(
+                text=f"🔗 [Click here to view the ad]({result.url})",
+                parse_mode=ParseMode.MARKDOWN,
+            )
+        elif result.outcome == NO_FILL:
+            await query.edit_message_text("⚠️ No ads available right now.")
+        elif result.outcome == HTTP_ERROR:
+            logger.error("Bad response from AdsGram: %s %s", result.status_code, truncate(result.body, LOG_MAX_FIELD))
+            await query.edit_message_text("❌ Failed to fetch ads. (API error)")
+        elif result.outcome == CIRCUIT_OPEN:
+            await query.edit_message_text("❌ Failed to fetch ads.")
+        else:
+            logger.error("Error fetching ad: %s", result.error)
+            await query.edit_message_text("❌ Failed to fetch ads.")
+
+    except Exception as e:
+        # Only when the fetch itself failed; a failed edit was already recorded with its result
+        if result is None:
+            result = AdResult(EXCEPTION, error=e)
+            context.bot_data["stats"].record(result)
+            record_attempt(context.bot_data, query.from_user.id, result)
+        logger.error("Error fetching ad: %s", e)
+        await query.edit_message_text("❌ Failed to fetch ads.")
+
+
 # Callback handler
+@timed(HANDLER_SECONDS.labels("button_handler"))
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
+    remember_user(update, context)
     await query.answer()
 
     if query.data == "show_ads":
-        try:
-            url = f"https://adsgram.ai/api/blocks/{BLOCK_ID}/start?telegram_id={query.from_user.id}"
-            response = requests.get(url, timeout=10)
-
-            if response.status_code == 200:
-                data = response.json()
-                if "url" in data:
-                    await query.edit_message_text(
-                        text=f"🔗 [Click here to view the ad]({data['url']})",
-                        parse_mode=ParseMode.MARKDOWN,
-                    )
-                else:
-                    await query.edit_message_text("⚠️ No ads available right now.")
-            else:
-                logger.error(f"Bad response from AdsGram: {response.status_code} {response.text}")
-                await query.edit_message_text("❌ Failed to fetch ads. (API error)")
-
-        except Exception as e:
-            logger.error(f"Error fetching ad: {e}")
-            await query.edit_message_text("❌ Failed to fetch ads.")
+        state = context.bot_data["user_state"]
+        state.incr(query.from_user.id, "clicks")
+        state.set(query.from_user.id, "last_ad", int(time.time()))
+        # Repeated taps on the same message share the first tap's fetch and edit
+        flights = context.bot_data["show_ads_flights"]
+        message_key = query.message.message_id if query.message else query.inline_message_id
+        await flights.do((query.from_user.id, message_key), lambda: show_ad(query, context))
 
 
-def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+# Admin: /profile [seconds] samples the whole process and replies with the hottest frames
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    profiler = context.bot_data["profiler"]
+    if profiler.running:
+        await update.message.reply_text("⏳ A profile is already running.")
+        return
+    try:
+        seconds = float(context.args[0]) if context.args else 30.0
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds]")
+        return
+    seconds = max(1.0, min(PROFILE_MAX_SECONDS, seconds))
+
+    await update.message.reply_text(f"⏱ Profiling for {seconds:.0f}s…")
+    # In the background, so this chat's dispatch lane isn't held for the whole profile
+    context.application.create_task(run_profile(update, profiler, seconds), update=update)
+
+
+async def run_profile(update: Update, profiler: SamplingProfiler, seconds: float):
+    try:
+        profile, path = await asyncio.to_thread(profile_to_file, profiler, seconds, PROFILE_DIR)
+    except (RuntimeError, OSError) as e:
+        await update.message.reply_text(f"❌ Profile failed: {e}")
+        return
+    logger.info("Profile of %.0fs written to %s", seconds, path)
+    await update.message.reply_text(f"📊 Profile written to {path}\n\n{profile.summary()}"[:4096])
+
+
+# Admin: /stats shows fill rate and AdsGram latency per block over the rolling windows
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(context.bot_data["stats"].report()[:4096])
+
+
+# Application lifecycle
+async def post_init(application: Application):
+    loop_monitor = LoopMonitor(interval=LOOP_MONITOR_INTERVAL, threshold=LOOP_STALL_THRESHOLD, debug=LOOP_DEBUG)
+    loop_monitor.start()
+    application.bot_data["loop_monitor"] = loop_monitor
+    application.bot_data["profiler"] = SamplingProfiler(PROFILE_INTERVAL, loop_thread_id=threading.get_ident())
+
+    exporter = None
+    if TRACE_ZIPKIN_URL:
+        exporter = ZipkinExporter(TRACE_ZIPKIN_URL)
+    elif TRACE_FILE:
+        exporter = FileExporter(TRACE_FILE)
+    if exporter is not None:
+        await exporter.start()
+        set_tracer(Tracer(exporter, sample_rate=TRACE_SAMPLE_RATE, slow_threshold=TRACE_SLOW_SECONDS))
+        application.bot_data["trace_exporter"] = exporter
+
+    breaker = CircuitBreaker(
+        "adsgram",
+        window=ADSGRAM_BREAKER_WINDOW,
+        min_calls=ADSGRAM_BREAKER_MIN_CALLS,
+        failure_rate=ADSGRAM_BREAKER_FAILURE_RATE,
+        slow_call_duration=ADSGRAM_BREAKER_SLOW_CALL,
+        slow_call_rate=ADSGRAM_BREAKER_SLOW_RATE,
+        open_duration=ADSGRAM_BREAKER_OPEN_SECONDS,
+        half_open_probes=ADSGRAM_BREAKER_PROBES,
+    )
+    negative_cache = NegativeCache(
+        ttl=ADS_NO_FILL_TTL,
+        max_entries=ADS_NO_FILL_MAX_ENTRIES,
+        exhaust_threshold=ADS_BLOCK_EXHAUST_THRESHOLD,
+        exhaust_window=ADS_BLOCK_EXHAUST_WINDOW,
+        exhaust_duration=ADS_BLOCK_EXHAUST_SECONDS,
+    )
+    adsgram = AdsGramClient(
+        BLOCK_IDS,
+        base_url=ADSGRAM_BASE_URL,
+        max_connections=ADSGRAM_MAX_CONNECTIONS,
+        max_keepalive_connections=ADSGRAM_MAX_KEEPALIVE,
+        keepalive_expiry=ADSGRAM_KEEPALIVE_EXPIRY,
+        timeout=ADSGRAM_TIMEOUT,
+        min_timeout=ADSGRAM_MIN_TIMEOUT,
+        timeout_multiplier=ADSGRAM_TIMEOUT_MULTIPLIER,
+        hedge=ADSGRAM_HEDGE,
+        hedge_budget=ADSGRAM_HEDGE_BUDGET,
+        breaker=breaker,
+        negative_cache=negative_cache,
+        dns_cache=application.bot_data["dns_cache"],
+    )
+    await adsgram.start()
+    application.bot_data["adsgram"] = adsgram
+
+    # Pay DNS, TCP and TLS setup now rather than on the first clicks; readiness waits until every target answers
+    warmer = KeepWarm(interval=WARM_PING_INTERVAL, timeout=WARMUP_TIMEOUT)
+    warmer.add("adsgram", lambda: adsgram.warm(ADSGRAM_WARM_CONNECTIONS))
+    warmer.add("telegram", lambda: asyncio.gather(*(application.bot.get_me() for _ in range(TELEGRAM_WARM_CONNECTIONS))))
+    cold = [name for name, ok in (await warmer.warm()).items() if not ok]
+    if cold:
+        logger.warning("Warm-up did not reach %s", ", ".join(cold))
+    warmer.start()
+    application.bot_data["warmer"] = warmer
+    users = UserRegistry(
+        USERS_DB, flush_interval=USERS_FLUSH_INTERVAL, flush_size=USERS_FLUSH_SIZE, max_pending=USERS_MAX_PENDING
+    )
+    await users.start()
+    application.bot_data["users"] = users
+
+    if EVENTS_DIR:
+        events = EventLog(
+            EVENTS_DIR,
+            capacity=EVENTS_BUFFER,
+            flush_interval=EVENTS_FLUSH_INTERVAL,
+            segment_bytes=EVENTS_SEGMENT_BYTES,
+            segment_seconds=EVENTS_SEGMENT_SECONDS,
+        )
+        await events.start()
+        application.bot_data["events"] = events
+    application.bot_data["stats"] = RollingStats(STATS_WINDOWS, buckets=STATS_BUCKETS)
+    adsgram.on_attempt = functools.partial(record_attempt, application.bot_data)
+    application.bot_data["show_ads_flights"] = SingleFlight("show_ads", linger=SHOW_ADS_DEDUP_SECONDS)
+
+    if ADS_PREFETCH:
+        application.bot_data["prefetcher"] = Prefetcher(
+            adsgram.fetch_ad, ttl=ADS_PREFETCH_TTL, max_entries=ADS_PREFETCH_MAX_ENTRIES
+        )
+
+    http = HTTPServer(port=PORT)
+    application.bot_data["http"] = http
+    health = application.bot_data["health"]
+    health.loop_monitor = loop_monitor
+    health.breaker = breaker
+    health.limiter = application.bot.rate_limiter
+    health.application = application
+    health.warmer = warmer
+
+    if BOT_MODE == "webhook":
+        add_webhook_route(http, application, WEBHOOK_PATH, WEBHOOK_SECRET, on_delivery=health.mark_delivery)
+    add_health_routes(http, health)
+    await http.start()
+
+    if METRICS_PATH:
+        metrics_http = HTTPServer(host=METRICS_HOST, port=METRICS_PORT)
+        add_metrics_route(metrics_http, METRICS_PATH)
+        await metrics_http.start()
+        application.bot_data["metrics_http"] = metrics_http
+    health.ready = True
+
+
+async def post_shutdown(application: Application):
+    health = application.bot_data.get("health")
+    if health is not None:
+        health.ready = False
+
+    for name in ("http", "metrics_http"):
+        server = application.bot_data.pop(name, None)
+        if server is not None:
+            await server.stop()
+
+    warmer = application.bot_data.pop("warmer", None)
+    if warmer is not None:
+        await warmer.stop()
+
+    prefetcher = application.bot_data.pop("prefetcher", None)
+    if prefetcher is not None:
+        await prefetcher.close()
+
+    adsgram = application.bot_data.pop("adsgram", None)
+    if adsgram is not None:
+        await adsgram.close()
+
+    users = application.bot_data.pop("users", None)
+    if users is not None:
+        await users.close()
+
+    events = application.bot_data.pop("events", None)
+    if events is not None:
+        await events.close()
+
+    exporter = application.bot_data.pop("trace_exporter", None)
+    if exporter is not None:
+        set_tracer(Tracer())
+        await exporter.close()
+
+    loop_monitor = application.bot_data.pop("loop_monitor", None)
+    if loop_monitor is not None:
+        await loop_monitor.stop()
+
+
+def build_application(request: Optional[BaseRequest] = None) -> Application:
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(TELEGRAM_API_BASE_URL)
+        .application_class(
+            LaneApplication,
+            kwargs={"lanes": BOT_CONCURRENCY, "lane_queue_size": BOT_LANE_QUEUE_SIZE},
+        )
+        .rate_limiter(
+            FloodLimiter(
+                global_rate=TELEGRAM_GLOBAL_RATE,
+                private_chat_rate=TELEGRAM_CHAT_RATE,
+                group_chat_rate=TELEGRAM_GROUP_RATE,
+                max_retries=TELEGRAM_MAX_RETRIES,
+            )
+        )
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    dns_cache = DNSCache(ttl=DNS_CACHE_TTL)
+    # Benchmarks swap in an in-memory Bot API
+    if request is None:
+        request = WarmHTTPXRequest(dns_cache, keepalive_expiry=TELEGRAM_KEEPALIVE_EXPIRY, connection_pool_size=256)
+    builder = builder.request(request)
+    if PERSISTENCE_DB:
+        # bot_data also holds the services; BotData keeps them out of the persisted copy
+        context_types = ContextTypes(bot_data=BotData)
+        builder = builder.context_types(context_types).persistence(
+            SQLitePersistence(PERSISTENCE_DB, update_interval=PERSISTENCE_INTERVAL, context_types=context_types)
+        )
+    # Every successful poll, even an empty one, counts as a sign of life for /healthz
+    health = HealthMonitor(mode=BOT_MODE, max_loop_lag=HEALTH_MAX_LOOP_LAG, max_delivery_age=HEALTH_MAX_POLL_AGE)
+    builder = builder.get_updates_request(HeartbeatRequest(health.mark_delivery, connection_pool_size=1))
+
+    application = builder.build()
+    application.bot_data["health"] = health
+    application.bot_data["dns_cache"] = dns_cache
+    # Per-user counters and timestamps, kept out of user_data dicts
+    application.bot_data["user_state"] = UserStateTable()
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("profile", profile_command, filters=filters.User(ADMIN_IDS)))
+    application.add_handler(CommandHandler("stats", stats_command, filters=filters.User(ADMIN_IDS)))
     application.add_handler(CallbackQueryHandler(button_handler))
-    application.run_polling()
+    return application
+
+
+def main():
+    application = build_application()
+
+    if BOT_MODE == "webhook":
+        run_webhook(
+            application,
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+import logging
+import time
+from collections import deque
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state (0 = closed, 1 = open, 2 = half-open)",
+    ("name",),
+)
+BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total",
+    "Circuit breaker state transitions",
+    ("name", "from_state", "to_state"),
+)
+BREAKER_REJECTED = Counter(
+    "circuit_breaker_rejected_total",
+    "Calls rejected without reaching the upstream because the breaker was open",
+    ("name",),
+)
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by the error and slow-call rate of recent calls."""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window: int = 50,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call_duration: float = 3.0,
+        slow_call_rate: float = 0.8,
+        open_duration: float = 15.0,
+        half_open_probes: int = 3,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+
+        # Sliding window of (failed, slow) outcomes with running totals
+        self._calls = deque(maxlen=window)
+        self._failures = 0
+        self._slow = 0
+
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        self._state_gauge = BREAKER_STATE.labels(name)
+        self._rejected = BREAKER_REJECTED.labels(name)
+        self._state_gauge.set(_STATE_VALUES[CLOSED])
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_duration:
+                self._rejected.inc()
+                return False
+            self._transition(HALF_OPEN)
+
+        # Half-open: let a limited number of probes through
+        if self._probes_in_flight >= self.half_open_probes:
+            self._rejected.inc()
+            return False
+        self._probes_in_flight += 1
+        return True
+
+    def release(self):
+        # An admitted call was abandoned before it produced an outcome
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record(self, failed: bool, latency: float):
+        slow = latency >= self.slow_call_duration
+
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if failed or slow:
+                self._transition(OPEN)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._transition(CLOSED)
+            return
+
+        if self.state == OPEN:
+            # A call admitted before the breaker opened; its outcome is stale
+            return
+
+        if len(self._calls) == self._calls.maxlen:
+            old_failed, old_slow = self._calls[0]
+            self._failures -= old_failed
+            self._slow -= old_slow
+        self._calls.append((failed, slow))
+        self._failures += failed
+        self._slow += slow
+
+        total = len(self._calls)
+        if total >= self.min_calls and (
+            self._failures / total >= self.failure_rate or self._slow / total >= self.slow_call_rate
+        ):
+            self._transition(OPEN)
+
+    def _transition(self, state: str):
+        previous = self.state
+        self.state = state
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        else:
+            self._calls.clear()
+            self._failures = 0
+            self._slow = 0
+
+        self._state_gauge.set(_STATE_VALUES[state])
+        BREAKER_TRANSITIONS.labels(self.name, previous, state).inc()
+        logger.warning("Circuit breaker '%s' %s -> %s", self.name, previous, state)
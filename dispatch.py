@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from types import MappingProxyType
+from typing import Any, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application
+
+import tracing
+from metrics import Counter, Gauge
+from persistence import LazyData
+
+logger = logging.getLogger(__name__)
+
+LANE_QUEUE_DEPTH = Gauge("dispatch_lane_queue_depth", "Updates waiting in per-user dispatch lanes")
+LANE_UPDATES = Counter("dispatch_updates_total", "Updates dispatched through per-user lanes")
+UPDATES_BY_TYPE = Counter("telegram_updates_total", "Updates received by type", ("type",))
+
+_UPDATE_TYPES = [str(kind) for kind in Update.ALL_TYPES]
+
+
+def update_type(update: object) -> str:
+    if isinstance(update, Update):
+        for attribute in _UPDATE_TYPES:
+            if getattr(update, attribute) is not None:
+                return attribute
+    return "other"
+
+
+class LaneApplication(Application):
+    """Application that processes updates concurrently while keeping each user's updates in order.
+
+    Updates are hashed by user (or chat) onto a fixed number of lanes. Each
+    lane is a queue drained by one worker, so updates from the same user run
+    one after another while different users are served in parallel, up to
+    ``lanes`` at a time. With lazy persistence, the update's user_data and
+    chat_data entries are loaded on a worker thread before it is processed.
+    """
+
+    def __init__(self, *, lanes: int = 32, lane_queue_size: int = 1000, **kwargs):
+        super().__init__(**kwargs)
+        self.lane_count = max(1, lanes)
+        self.lane_queue_size = lane_queue_size
+        self._lanes: List[asyncio.Queue] = []
+        self._lane_workers: List[asyncio.Task] = []
+
+        # Lazy persistence: user_data/chat_data entries are loaded per update instead of at startup
+        self._lazy_data = hasattr(self.persistence, "load_user_data")
+        if self._lazy_data:
+            self._user_data = LazyData(self.context_types.user_data, self.persistence.load_user_data)
+            self.user_data = MappingProxyType(self._user_data)
+            self._chat_data = LazyData(self.context_types.chat_data, self.persistence.load_chat_data)
+            self.chat_data = MappingProxyType(self._chat_data)
+
+    @staticmethod
+    def lane_key(update: object) -> int:
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+        return 0
+
+    def lane_depth(self) -> int:
+        return sum(lane.qsize() for lane in self._lanes)
+
+    async def _initialize_persistence(self):
+        # Loading persisted bot_data replaces the dict, dropping what build_application put there
+        services = dict(self.bot_data)
+        await super()._initialize_persistence()
+        self.bot_data.update(services)
+
+    def _mark_for_persistence_update(self, *, update: object = None, job=None):
+        # Only entries a handler loaded or created can have changed; marking the rest would
+        # make update_persistence create (and write) an empty dict for every user seen
+        if isinstance(update, Update):
+            if update.effective_chat and update.effective_chat.id in self._chat_data:
+                self._chat_ids_to_be_updated_in_persistence.add(update.effective_chat.id)
+            if update.effective_user and update.effective_user.id in self._user_data:
+                self._user_ids_to_be_updated_in_persistence.add(update.effective_user.id)
+        if job:
+            if job.chat_id and job.chat_id in self._chat_data:
+                self._chat_ids_to_be_updated_in_persistence.add(job.chat_id)
+            if job.user_id and job.user_id in self._user_data:
+                self._user_ids_to_be_updated_in_persistence.add(job.user_id)
+
+    async def _load_data(self, update: object):
+        if not self._lazy_data or not isinstance(update, Update):
+            return
+        user_id = update.effective_user.id if update.effective_user else None
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        if user_id in self._user_data:
+            user_id = None
+        if chat_id in self._chat_data:
+            chat_id = None
+        if user_id is None and chat_id is None:
+            return
+        user_data, chat_data = await asyncio.to_thread(self._read_data, user_id, chat_id)
+        # Handlers read both on every update anyway, so a miss gets its (unwritten) empty entry now;
+        # setdefault keeps an entry another lane created for the same chat meanwhile
+        if user_id is not None:
+            self._user_data.setdefault(user_id, self.context_types.user_data() if user_data is None else user_data)
+        if chat_id is not None:
+            self._chat_data.setdefault(chat_id, self.context_types.chat_data() if chat_data is None else chat_data)
+
+    def _read_data(self, user_id: Optional[int], chat_id: Optional[int]) -> Tuple[Any, Any]:
+        user_data = self.persistence.load_user_data(user_id) if user_id is not None else None
+        chat_data = self.persistence.load_chat_data(chat_id) if chat_id is not None else None
+        return user_data, chat_data
+
+    async def start(self):
+        await super().start()
+        self._lanes = [asyncio.Queue(self.lane_queue_size) for _ in range(self.lane_count)]
+        self._lane_workers = [asyncio.create_task(self._lane_worker(lane)) for lane in self._lanes]
+        logger.info("Dispatching updates on %d per-user lanes", self.lane_count)
+
+    async def stop(self):
+        # Hand everything already fetched to the lanes and let them finish
+        await self.update_queue.join()
+        await self._drain_lanes()
+        await super().stop()
+        await self._drain_lanes()
+
+        for worker in self._lane_workers:
+            worker.cancel()
+        await asyncio.gather(*self._lane_workers, return_exceptions=True)
+        self._lanes = []
+        self._lane_workers = []
+
+    async def process_update(self, update: object):
+        kind = update_type(update)
+        UPDATES_BY_TYPE.labels(kind).inc()
+        if not self._lanes:
+            with tracing.trace("update", type=kind):
+                await self._load_data(update)
+                await super().process_update(update)
+            return
+
+        # Called by the update fetcher: enqueue and return so the next update can be fetched
+        lane = self._lanes[hash(self.lane_key(update)) % self.lane_count]
+        LANE_UPDATES.inc()
+        LANE_QUEUE_DEPTH.inc()
+        await lane.put((time.perf_counter(), kind, update))
+
+    async def _lane_worker(self, lane: asyncio.Queue):
+        while True:
+            enqueued, kind, update = await lane.get()
+            LANE_QUEUE_DEPTH.dec()
+            try:
+                with tracing.trace("update", type=kind) as root:
+                    if root is not None:
+                        root.set_tag("lane_wait_ms", round((time.perf_counter() - enqueued) * 1000, 3))
+                    await self._load_data(update)
+                    await Application.process_update(self, update)
+            except Exception as e:
+                logger.error("Error processing update in lane: %s", e)
+            finally:
+                lane.task_done()
+
+    async def _drain_lanes(self):
+        await asyncio.gather(*(lane.join() for lane in self._lanes))
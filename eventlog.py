@@ -0,0 +1,258 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+from array import array
+from typing import Dict, List, Optional
+
+from adsgram import AdResult, EXCEPTION, FILLED, HTTP_ERROR
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+AD_EVENTS = Counter("ad_events_total", "Ad request events by fate (written, dropped when the ring was full)", ("result",))
+EVENT_SEGMENTS = Counter("ad_event_segments_total", "Event log segments by stage (rolled, compacted, failed)", ("stage",))
+
+COLUMNS = ("ts", "telegram_id", "block_id", "outcome", "latency_ms", "detail")
+
+OPEN_SUFFIX = ".jsonl.open"
+ROW_SUFFIX = ".jsonl"
+COLUMNAR_SUFFIX = ".evc"
+_MAGIC = b"EVC1\n"
+
+
+def _row(ts: float, telegram_id: int, result: AdResult) -> list:
+    if result.outcome == FILLED:
+        detail = result.url or ""
+    elif result.outcome == HTTP_ERROR:
+        detail = str(result.status_code)
+    elif result.outcome == EXCEPTION:
+        detail = type(result.error).__name__ if result.error is not None else ""
+    elif result.cached:
+        # Answered from the negative cache; nothing was sent to AdsGram
+        detail = "cached"
+    else:
+        detail = ""
+    return [round(ts, 3), telegram_id, result.block_id or "", result.outcome, round(result.latency * 1000, 2), detail]
+
+
+class EventLog:
+    """Audit trail of every AdsGram attempt, written to rolling segment files.
+
+    ``log_ad`` stores a reference in a fixed-size ring buffer and returns;
+    the ring is only touched from the event loop thread, so it needs no
+    lock. A background task drains it every ``flush_interval`` seconds and
+    appends JSON lines to the open segment on a worker thread. Segments roll
+    over at ``segment_bytes`` or ``segment_seconds`` and are then compacted
+    into the columnar ``.evc`` format (see ``compact_segment``). When the ring
+    is full, new events are dropped and counted rather than blocking.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        capacity: int = 65536,
+        flush_interval: float = 1.0,
+        segment_bytes: int = 64 * 1024 * 1024,
+        segment_seconds: float = 3600.0,
+    ):
+        self.directory = directory
+        # Round up to a power of two so the slot is an index mask
+        size = 1 << max(0, capacity - 1).bit_length()
+        self._slots: List[Optional[tuple]] = [None] * size
+        self._mask = size - 1
+        self._size = size
+        self._head = 0
+        self._tail = 0
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self._file = None
+        self._path: Optional[str] = None
+        self._opened = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+        self._written = AD_EVENTS.labels("written")
+        self._dropped = AD_EVENTS.labels("dropped")
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def log_ad(self, telegram_id: int, result: AdResult):
+        head = self._head
+        if head - self._tail >= self._size:
+            self._dropped.inc()
+            return
+        self._slots[head & self._mask] = (time.time(), telegram_id, result)
+        self._head = head + 1
+
+    async def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # Segments left behind by a crash or an interrupted compaction
+        await asyncio.to_thread(self._recover)
+        self._task = asyncio.create_task(self._run())
+        logger.info("Logging ad events to %s", self.directory)
+
+    async def close(self):
+        if self._task is not None:
+            # Cancelling would leave a write running on its worker thread
+            self._stop.set()
+            await self._task
+            self._task = None
+        await self.flush(roll=True)
+
+    async def flush(self, roll: bool = False):
+        events = self._drain()
+        rolled = await asyncio.to_thread(self._write, events, roll)
+        if rolled is not None:
+            await asyncio.to_thread(self._compact, rolled)
+
+    def _drain(self) -> List[tuple]:
+        slots, mask = self._slots, self._mask
+        events = []
+        for i in range(self._tail, self._head):
+            events.append(slots[i & mask])
+            slots[i & mask] = None
+        self._tail = self._head
+        return events
+
+    async def _run(self):
+        while not self._stop.is_set():
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._stop.wait(), self.flush_interval)
+            try:
+                await self.flush()
+            except OSError as e:
+                logger.error("Failed to write ad events to %s: %s", self.directory, e)
+
+    # Worker thread side
+
+    def _write(self, events: List[tuple], roll: bool) -> Optional[str]:
+        if events:
+            if self._file is None:
+                self._open_segment()
+            lines = [json.dumps(_row(*event), ensure_ascii=False, separators=(",", ":")) + "\n" for event in events]
+            self._file.write("".join(lines))
+            self._file.flush()
+            self._written.inc(len(events))
+        if self._file is None:
+            return None
+        if roll or self._file.tell() >= self.segment_bytes or time.time() - self._opened >= self.segment_seconds:
+            return self._close_segment()
+        return None
+
+    def _open_segment(self):
+        self._opened = time.time()
+        name = time.strftime("events-%Y%m%d-%H%M%S", time.gmtime(self._opened))
+        path = os.path.join(self.directory, name)
+        # Two rolls in the same second get a suffix
+        n = 0
+        while any(os.path.exists(path + suffix) for suffix in (OPEN_SUFFIX, ROW_SUFFIX, COLUMNAR_SUFFIX)):
+            n += 1
+            path = os.path.join(self.directory, f"{name}-{n}")
+        self._path = path
+        self._file = open(path + OPEN_SUFFIX, "a", encoding="utf-8")
+
+    def _close_segment(self) -> str:
+        self._file.close()
+        self._file = None
+        path = self._path + ROW_SUFFIX
+        os.replace(self._path + OPEN_SUFFIX, path)
+        EVENT_SEGMENTS.labels("rolled").inc()
+        return path
+
+    def _compact(self, path: str):
+        try:
+            compact_segment(path)
+        except (OSError, ValueError) as e:
+            # The row file stays; the next start retries it
+            EVENT_SEGMENTS.labels("failed").inc()
+            logger.error("Failed to compact %s: %s", path, e)
+            return
+        EVENT_SEGMENTS.labels("compacted").inc()
+
+    def _recover(self):
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(OPEN_SUFFIX):
+                os.replace(path, path[: -len(OPEN_SUFFIX)] + ROW_SUFFIX)
+                path = path[: -len(OPEN_SUFFIX)] + ROW_SUFFIX
+            elif not name.endswith(ROW_SUFFIX):
+                continue
+            self._compact(path)
+
+
+def compact_segment(path: str) -> str:
+    """Rewrite a closed ``.jsonl`` segment as ``.evc`` and remove the row file.
+
+    The ``.evc`` file is ``EVC1\\n``, a JSON header line, then one
+    zlib-compressed blob per column: timestamps as millisecond deltas
+    (int64), telegram ids as int64, latencies as float32 and the string
+    columns dictionary-encoded as uint32 codes with the values in the header.
+    """
+    columns: Dict[str, list] = {name: [] for name in COLUMNS}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                # Torn last line from a crash mid-write
+                break
+            for name, value in zip(COLUMNS, json.loads(line)):
+                columns[name].append(value)
+
+    header_columns = []
+    blobs = []
+
+    def add(name: str, encoding: str, data: array, **extra):
+        blob = zlib.compress(data.tobytes(), 9)
+        header_columns.append({"name": name, "encoding": encoding, "type": data.typecode, "bytes": len(blob), **extra})
+        blobs.append(blob)
+
+    ms = [int(ts * 1000) for ts in columns["ts"]]
+    add("ts", "delta_ms", array("q", [b - a for a, b in zip([0] + ms, ms)]))
+    add("telegram_id", "plain", array("q", columns["telegram_id"]))
+    add("latency_ms", "plain", array("f", columns["latency_ms"]))
+    for name in ("block_id", "outcome", "detail"):
+        values: Dict[str, int] = {}
+        codes = array("I", (values.setdefault(value, len(values)) for value in columns[name]))
+        add(name, "dict", codes, values=list(values))
+
+    header = {"rows": len(ms), "byteorder": sys.byteorder, "columns": header_columns}
+    target = path[: -len(ROW_SUFFIX)] + COLUMNAR_SUFFIX
+    with open(target + ".tmp", "wb") as f:
+        f.write(_MAGIC)
+        f.write(json.dumps(header).encode() + b"\n")
+        for blob in blobs:
+            f.write(blob)
+    os.replace(target + ".tmp", target)
+    os.remove(path)
+    return target
+
+
+def read_segment(path: str) -> Dict[str, list]:
+    """Columns of a compacted ``.evc`` segment, in ``COLUMNS`` order, as plain lists."""
+    with open(path, "rb") as f:
+        if f.readline() != _MAGIC:
+            raise ValueError(f"{path} is not an event segment")
+        header = json.loads(f.readline())
+        columns = {}
+        for column in header["columns"]:
+            data = array(column["type"])
+            data.frombytes(zlib.decompress(f.read(column["bytes"])))
+            if header["byteorder"] != sys.byteorder:
+                data.byteswap()
+            if column["encoding"] == "delta_ms":
+                total, values = 0, []
+                for delta in data:
+                    total += delta
+                    values.append(total / 1000)
+            elif column["encoding"] == "dict":
+                values = [column["values"][code] for code in data]
+            else:
+                values = data.tolist()
+            columns[column["name"]] = values
+    return {name: columns[name] for name in COLUMNS}
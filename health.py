@@ -0,0 +1,105 @@
+import json
+import time
+from http import HTTPStatus
+from typing import Callable, Optional, Tuple
+
+from telegram.request import HTTPXRequest
+
+from http_server import HTTPServer, Request, Response
+
+
+class HealthMonitor:
+    """Health and readiness computed from state the bot already keeps.
+
+    Probes read cached values only (loop lag from the LoopMonitor, the time of
+    the last successful getUpdates or webhook delivery, breaker state, queue
+    depths and the last warm-up ping per upstream), so they answer in
+    constant time and never call upstreams. Readiness also waits until the
+    warm-up has reached every upstream once; later failed pings only show in
+    the state, so an AdsGram outage does not take the bot out of rotation.
+    """
+
+    def __init__(self, *, mode: str = "polling", max_loop_lag: float = 1.0, max_delivery_age: float = 120.0):
+        self.mode = mode
+        self.max_loop_lag = max_loop_lag
+        self.max_delivery_age = max_delivery_age
+        self.ready = False
+        self.started = time.monotonic()
+        self.last_delivery: Optional[float] = None
+        # Filled in by post_init once the services exist
+        self.loop_monitor = None
+        self.breaker = None
+        self.limiter = None
+        self.application = None
+        self.warmer = None
+
+    def is_ready(self) -> bool:
+        # Without periodic pings nothing would retry a failed warm-up, so it can't hold readiness back
+        warm = self.warmer is None or self.warmer.warmed or self.warmer.interval <= 0
+        return self.ready and warm
+
+    def mark_delivery(self):
+        self.last_delivery = time.monotonic()
+
+    def check(self) -> Tuple[bool, dict]:
+        now = time.monotonic()
+        problems = []
+        state = {"mode": self.mode, "ready": self.is_ready(), "uptime_seconds": round(now - self.started, 1)}
+
+        if self.loop_monitor is not None:
+            lag = max(self.loop_monitor.lag, self.loop_monitor.stalled_for())
+            state["loop_lag_ms"] = round(lag * 1000, 1)
+            if lag > self.max_loop_lag:
+                problems.append("event loop lagging")
+
+        since = now - (self.last_delivery if self.last_delivery is not None else self.started)
+        state["seconds_since_delivery"] = round(since, 1)
+        # Long polling returns at least every poll timeout; webhooks only arrive with traffic
+        if self.mode == "polling" and since > self.max_delivery_age:
+            problems.append("getUpdates stalled")
+
+        if self.breaker is not None:
+            state["adsgram_circuit"] = self.breaker.state
+        if self.limiter is not None:
+            state["send_queue_depth"] = self.limiter.queue_depth
+        if self.application is not None:
+            state["lane_queue_depth"] = self.application.lane_depth()
+        if self.warmer is not None:
+            state["warm"] = dict(self.warmer.status)
+
+        state["status"] = "ok" if not problems else "unhealthy"
+        if problems:
+            state["problems"] = problems
+        return not problems, state
+
+
+def add_health_routes(server: HTTPServer, health: HealthMonitor, *, health_path: str = "/healthz", ready_path: str = "/readyz"):
+    """Liveness on ``health_path`` and readiness on ``ready_path``; both answer 503 when failing."""
+
+    def reply(ok: bool, body: dict) -> Response:
+        status = HTTPStatus.OK if ok else HTTPStatus.SERVICE_UNAVAILABLE
+        return Response(status, json.dumps(body).encode(), "application/json")
+
+    async def healthz(request: Request) -> Response:
+        return reply(*health.check())
+
+    async def readyz(request: Request) -> Response:
+        healthy, state = health.check()
+        return reply(healthy and state["ready"], state)
+
+    server.route("GET", health_path, healthz)
+    server.route("GET", ready_path, readyz)
+
+
+class HeartbeatRequest(HTTPXRequest):
+    """HTTPXRequest for getUpdates that reports each successful poll, including empty ones."""
+
+    def __init__(self, on_success: Callable[[], None], **kwargs):
+        super().__init__(**kwargs)
+        self._on_success = on_success
+
+    async def do_request(self, *args, **kwargs):
+        status, payload = await super().do_request(*args, **kwargs)
+        if 200 <= status < 300:
+            self._on_success()
+        return status, payload
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+IDLE_TIMEOUT = 30.0
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, list]
+    headers: Dict[str, str]
+    body: bytes = b""
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: Dict[str, str] = field(default_factory=dict)
+    # Optional body producer for paced responses; ``body`` is ignored when set
+    stream: Optional[Callable[[], AsyncIterator[bytes]]] = None
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HTTPServer:
+    """Small asyncio HTTP/1.1 server for the bot's own endpoints.
+
+    Requests are handled on the event loop that runs the Application, so a
+    handler can hand work to the bot without any thread hop.
+    """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 8080):
+        self.host = host
+        self.port = port
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = set()
+
+    def route(self, method: str, path: str, handler: Handler):
+        self.routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+            logger.info("HTTP server listening on %s:%s", self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would otherwise hold wait_closed() open
+            tasks = list(self._connections)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+            logger.info("HTTP server stopped")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._write(writer, Response(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE), False)
+                    return
+                if len(head) > MAX_HEADER_BYTES:
+                    await self._write(writer, Response(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE), False)
+                    return
+
+                request = self._parse_head(head)
+                if request is None:
+                    await self._write(writer, Response(HTTPStatus.BAD_REQUEST), False)
+                    return
+
+                if "transfer-encoding" in request.headers:
+                    await self._write(writer, Response(HTTPStatus.LENGTH_REQUIRED), False)
+                    return
+                try:
+                    length = int(request.headers.get("content-length", "0") or 0)
+                except ValueError:
+                    await self._write(writer, Response(HTTPStatus.BAD_REQUEST), False)
+                    return
+                if length > MAX_BODY_BYTES:
+                    await self._write(writer, Response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE), False)
+                    return
+                if length:
+                    try:
+                        request.body = await asyncio.wait_for(reader.readexactly(length), IDLE_TIMEOUT)
+                    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                        return
+
+                response = await self._dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                await self._write(writer, response, keep_alive, send_body=request.method != "HEAD")
+                if not keep_alive:
+                    return
+        except asyncio.CancelledError:
+            # Server shutdown; the connection task ends here
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None and request.method == "HEAD":
+            handler = self.routes.get(("GET", request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return Response(HTTPStatus.METHOD_NOT_ALLOWED)
+            return Response(HTTPStatus.NOT_FOUND)
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error("Error handling %s %s: %s", request.method, request.path, e)
+            return Response(HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    def _parse_head(self, head: bytes) -> Optional[Request]:
+        try:
+            lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        return Request(method.upper(), url.path, parse_qs(url.query), headers)
+
+    async def _write(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool, send_body: bool = True):
+        status = int(response.status)
+        # Codes outside the enum (520, 599, ...) are valid on the wire; the fake AdsGram sends them
+        phrase = HTTPStatus(status).phrase if status in HTTPStatus._value2member_map_ else "Unknown"
+        body = response.body or b""
+        if not body and status >= 400:
+            body = f"{status} {phrase}\n".encode()
+        headers = {
+            "Content-Type": response.content_type,
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **response.headers,
+        }
+        head = f"HTTP/1.1 {status} {phrase}\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in headers.items()
+        )
+        try:
+            if not send_body:
+                # HEAD: same headers, including Content-Length, but no body
+                writer.write(head.encode("latin-1") + b"\r\n")
+                await writer.drain()
+            elif response.stream is None:
+                writer.write(head.encode("latin-1") + b"\r\n" + body)
+                await writer.drain()
+            else:
+                writer.write(head.encode("latin-1") + b"\r\n")
+                async for chunk in response.stream():
+                    writer.write(chunk)
+                    await writer.drain()
+        except ConnectionError:
+            pass
@@ -0,0 +1,36 @@
+from array import array
+
+
+class LatencyTracker:
+    """Rolling window of latency samples with periodically refreshed percentiles."""
+
+    def __init__(self, window: int = 512, refresh_every: int = 32):
+        self.window = window
+        self.refresh_every = refresh_every
+        self._samples = array("d", bytes(8 * window))
+        self._next = 0
+        self.count = 0
+        self._since_refresh = 0
+        self.p50 = self.p95 = self.p99 = 0.0
+
+    def observe(self, seconds: float) -> bool:
+        """Record a sample; returns True when the percentiles were refreshed."""
+        self._samples[self._next] = seconds
+        self._next = (self._next + 1) % self.window
+        if self.count < self.window:
+            self.count += 1
+
+        # Sorting the window is O(n log n), so only do it every few samples
+        self._since_refresh += 1
+        if self._since_refresh >= self.refresh_every or self.count < self.refresh_every:
+            self._refresh()
+            return True
+        return False
+
+    def _refresh(self):
+        self._since_refresh = 0
+        ordered = sorted(self._samples[: self.count])
+        last = self.count - 1
+        self.p50 = ordered[min(last, int(0.50 * self.count))]
+        self.p95 = ordered[min(last, int(0.95 * self.count))]
+        self.p99 = ordered[min(last, int(0.99 * self.count))]
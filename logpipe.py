@@ -0,0 +1,161 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+from typing import Hashable, Tuple
+
+import tracing
+from metrics import Counter
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records that were not written, by reason (rate_limited, queue_full)",
+    ("reason",),
+)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else was passed through ``extra=``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def truncate(value, limit: int):
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}... [{len(value) - limit} more chars]"
+    return value
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets each message template through at most ``burst`` times per ``interval``.
+
+    Records are keyed by logger, level and the unformatted message, so an
+    error storm logging the same template with different arguments collapses
+    into ``burst`` lines plus a ``suppressed`` count on the next line that
+    gets through. Suppressed records are never formatted.
+    """
+
+    def __init__(self, burst: int = 20, interval: float = 60.0, max_keys: int = 1000):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_keys = max_keys
+        # key -> [window_start, emitted, suppressed]
+        self._windows: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._rate_limited = LOG_RECORDS_DROPPED.labels("rate_limited")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.CRITICAL:
+            return True
+        template = record.msg if isinstance(record.msg, str) else type(record.msg).__name__
+        key: Tuple = (record.name, record.levelno, template)
+        now = time.monotonic()
+
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            if window is not None and window[2]:
+                record.suppressed = window[2]
+            window = [now, 0, 0]
+            self._windows[key] = window
+            self._windows.move_to_end(key)
+            if len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        self._rate_limited.inc()
+        return False
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; fields passed with ``extra=`` are kept as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AsyncQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller: formatting and I/O happen on the listener thread.
+
+    Only the message arguments are resolved here, so the record no longer
+    references mutable objects once it is queued. Callers logging upstream
+    response bodies cut them with ``truncate`` first.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self._queue_full = LOG_RECORDS_DROPPED.labels("queue_full")
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        trace_id = tracing.current_trace_id()
+        if trace_id is not None:
+            record.trace_id = trace_id
+        if record.exc_info:
+            # Tracebacks hold frames; render them now and drop the references
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._queue_full.inc()
+
+
+def stop_listener(listener: QueueListener):
+    """Flush queued records; safe to call more than once."""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def configure_logging(
+    *,
+    level: str = "INFO",
+    fmt: str = "json",
+    queue_size: int = 10000,
+    burst: int = 20,
+    interval: float = 60.0,
+) -> QueueListener:
+    """Route all logging through a bounded queue to a stderr writer thread."""
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JSONFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_listener, listener)
+
+    handler = AsyncQueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter(burst=burst, interval=interval))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    return listener
@@ -0,0 +1,194 @@
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a scheduled wake-up",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LOOP_STALLS = Counter("event_loop_stalls_total", "Times the event loop was blocked past the stall threshold")
+BLOCKING_CALLS = Counter(
+    "event_loop_blocking_calls_total",
+    "Synchronous network or file calls made on the event loop thread (debug mode)",
+    ("call",),
+)
+
+# Audit events that block the calling thread when made on the loop thread; "time.sleep" is only raised on 3.13+
+_BLOCKING_EVENTS = {"socket.getaddrinfo", "socket.gethostbyname", "socket.connect", "open", "time.sleep"}
+
+_ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+
+
+def format_task_stack(frame) -> str:
+    """Format a loop-thread stack, dropping the event loop's own frames above the running callback."""
+    summary = traceback.extract_stack(frame)
+    for i in range(len(summary) - 1, -1, -1):
+        if summary[i].filename.startswith(_ASYNCIO_DIR):
+            summary = summary[i + 1 :] or summary
+            break
+    return "".join(traceback.format_list(summary)).rstrip()
+
+
+class LoopMonitor:
+    """Measures event-loop lag and reports what blocked the loop.
+
+    A task sleeps for ``interval`` and records how late it woke up. A
+    watchdog thread checks that task's heartbeat; when the loop has not
+    ticked for ``threshold`` seconds it logs the loop thread's current stack:
+    a single blocking call shows up as the same frame in every report, while
+    a loop that is merely saturated shows a different stack each time.
+
+    With ``debug`` enabled, an audit hook also flags synchronous DNS lookups,
+    blocking socket connects and file opens made from a running task on the
+    loop thread, plus time.sleep on Python 3.13 and later (earlier versions
+    raise no audit event for it).
+    """
+
+    def __init__(self, *, interval: float = 0.1, threshold: float = 0.25, debug: bool = False):
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        if self.debug:
+            _install_audit_hook(self)
+        logger.info(
+            "Loop monitor started (interval=%ss, threshold=%ss, debug=%s)", self.interval, self.threshold, self.debug
+        )
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+        if _audit_state.monitor is self:
+            _audit_state.monitor = None
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            self._heartbeat = time.monotonic()
+
+    def stalled_for(self) -> float:
+        """Seconds the loop is overdue for its next tick; non-zero only while it is blocked."""
+        if self._task is None:
+            return 0.0
+        return max(0.0, time.monotonic() - self._heartbeat - self.interval)
+
+    def _watch(self):
+        reported = False
+        while not self._stopped.wait(self.threshold / 2):
+            stalled = self.stalled_for()
+            if stalled < self.threshold:
+                reported = False
+                continue
+            # One report per stall: the stack is taken as soon as it crosses the threshold
+            if not reported:
+                reported = True
+                LOOP_STALLS.inc()
+                logger.warning(
+                    "Event loop stalled for %.3fs, running %s:\n%s", stalled, self._current_task_name(), self._loop_stack()
+                )
+
+    def _loop_stack(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return "  <loop thread not running>"
+        return format_task_stack(frame)
+
+    def _current_task_name(self) -> str:
+        task = None
+        with contextlib.suppress(RuntimeError):
+            task = asyncio.current_task(self._loop)
+        return task.get_name() if task is not None else "<no task>"
+
+    def is_loop_thread(self) -> bool:
+        return threading.get_ident() == self._loop_thread_id
+
+
+class _AuditState:
+    installed = False
+    monitor: Optional[LoopMonitor] = None
+    reporting = threading.local()
+    # (event, filename, lineno) already logged; repeats are only counted
+    reported_sites: set = set()
+
+
+_audit_state = _AuditState()
+
+
+def _install_audit_hook(monitor: LoopMonitor):
+    # Audit hooks cannot be removed, so install once and point it at the current monitor
+    _audit_state.monitor = monitor
+    if not _audit_state.installed:
+        _audit_state.installed = True
+        sys.addaudithook(_audit)
+
+
+def _audit(event: str, args: tuple):
+    if event not in _BLOCKING_EVENTS:
+        return
+    monitor = _audit_state.monitor
+    if monitor is None or not monitor.is_loop_thread() or getattr(_audit_state.reporting, "active", False):
+        return
+    if event == "socket.connect" and not (isinstance(args[0], socket.socket) and args[0].getblocking()):
+        # asyncio's own connects use non-blocking sockets
+        return
+    caller = sys._getframe(1)
+    if event == "open":
+        # os.fdopen wraps an existing descriptor; imports read .py/.pyc files once and are not handler I/O
+        if not isinstance(args[0], (str, bytes)) or caller.f_code.co_filename.startswith("<frozen"):
+            return
+    with contextlib.suppress(RuntimeError):
+        if asyncio.current_task(monitor._loop) is None:
+            return
+
+    BLOCKING_CALLS.labels(event).inc()
+    site = (event, caller.f_code.co_filename, caller.f_lineno)
+    if site in _audit_state.reported_sites:
+        return
+    _audit_state.reported_sites.add(site)
+
+    _audit_state.reporting.active = True
+    try:
+        logger.warning("Blocking call %s%r on the event loop thread:\n%s", event, args[:2], format_task_stack(caller))
+    finally:
+        _audit_state.reporting.active = False
@@ -0,0 +1,102 @@
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Hashable, Tuple
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+NEGATIVE_CACHE_HITS = Counter(
+    "adsgram_negative_cache_hits_total",
+    "AdsGram requests skipped because a recent empty fill was cached (user or block_exhausted)",
+    ("scope",),
+)
+NEGATIVE_CACHE_ENTRIES = Gauge("adsgram_negative_cache_entries", "Cached (block, user) empty fills")
+BLOCK_EXHAUSTED = Gauge(
+    "adsgram_block_exhausted",
+    "1 while a block is short-circuited after a burst of empty fills",
+    ("block",),
+)
+
+
+class NegativeCache:
+    """Short-lived LRU of "no ads available" answers keyed by (block, telegram_id).
+
+    A burst of empty fills on one block marks the whole block exhausted for a
+    few seconds, so every user skips AdsGram until it is likely to fill again.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: float = 10.0,
+        max_entries: int = 50000,
+        exhaust_threshold: int = 20,
+        exhaust_window: float = 5.0,
+        exhaust_duration: float = 5.0,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.exhaust_threshold = exhaust_threshold
+        self.exhaust_window = exhaust_window
+        self.exhaust_duration = exhaust_duration
+        # (block, telegram_id) -> expires_at, least recently used first
+        self._entries: "OrderedDict[Tuple[Hashable, int], float]" = OrderedDict()
+        # block -> timestamps of empty fills since the block last filled
+        self._empties: Dict[Hashable, deque] = {}
+        self._exhausted_until: Dict[Hashable, float] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_empty(self, block_id: Hashable, telegram_id: int) -> bool:
+        now = time.monotonic()
+
+        exhausted_until = self._exhausted_until.get(block_id)
+        if exhausted_until is not None:
+            if now < exhausted_until:
+                NEGATIVE_CACHE_HITS.labels("block_exhausted").inc()
+                return True
+            del self._exhausted_until[block_id]
+            BLOCK_EXHAUSTED.labels(block_id).set(0)
+
+        key = (block_id, telegram_id)
+        expires_at = self._entries.get(key)
+        if expires_at is None:
+            return False
+        if now >= expires_at:
+            del self._entries[key]
+            NEGATIVE_CACHE_ENTRIES.set(len(self._entries))
+            return False
+        self._entries.move_to_end(key)
+        NEGATIVE_CACHE_HITS.labels("user").inc()
+        return True
+
+    def record_no_fill(self, block_id: Hashable, telegram_id: int):
+        now = time.monotonic()
+        key = (block_id, telegram_id)
+        self._entries[key] = now + self.ttl
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        NEGATIVE_CACHE_ENTRIES.set(len(self._entries))
+
+        empties = self._empties.get(block_id)
+        if empties is None:
+            empties = self._empties[block_id] = deque()
+        empties.append(now)
+        while empties and now - empties[0] > self.exhaust_window:
+            empties.popleft()
+        if len(empties) >= self.exhaust_threshold:
+            empties.clear()
+            self._exhausted_until[block_id] = now + self.exhaust_duration
+            BLOCK_EXHAUSTED.labels(block_id).set(1)
+            logger.warning("AdsGram block %s exhausted, skipping it for %ss", block_id, self.exhaust_duration)
+
+    def record_fill(self, block_id: Hashable, telegram_id: int):
+        empties = self._empties.get(block_id)
+        if empties:
+            empties.clear()
+        if self._entries.pop((block_id, telegram_id), None) is not None:
+            NEGATIVE_CACHE_ENTRIES.set(len(self._entries))
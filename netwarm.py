@@ -0,0 +1,202 @@
+import asyncio
+import contextlib
+import ipaddress
+import logging
+import socket
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import httpcore
+import httpx
+from telegram.request import HTTPXRequest
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+DNS_LOOKUPS = Counter("dns_cache_lookups_total", "DNS cache lookups by result (hit, miss, stale)", ("result",))
+WARM_PINGS = Counter("warm_pings_total", "Keep-alive pings by target and result", ("target", "result"))
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+class DNSCache:
+    """Caches getaddrinfo results per (host, port) for ``ttl`` seconds.
+
+    Lookups run through loop.getaddrinfo, i.e. in the default executor, never
+    on the loop thread. An expired entry is still served while a background
+    refresh runs, so no request waits on DNS after the first resolution.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        # (host, port) -> (expires_at, addresses)
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self._refreshing: Dict[Tuple[str, int], asyncio.Task] = {}
+
+    async def resolve(self, host: str, port: int) -> List[str]:
+        key = (host, port)
+        entry = self._entries.get(key)
+        if entry is None:
+            DNS_LOOKUPS.labels("miss").inc()
+            # Concurrent first connections share one lookup
+            return await asyncio.shield(self._start_lookup(key))
+        if entry[0] <= time.monotonic():
+            DNS_LOOKUPS.labels("stale").inc()
+            self._start_lookup(key)
+        else:
+            DNS_LOOKUPS.labels("hit").inc()
+        return entry[1]
+
+    def invalidate(self, host: str, port: int):
+        self._entries.pop((host, port), None)
+
+    def _start_lookup(self, key: Tuple[str, int]) -> asyncio.Task:
+        task = self._refreshing.get(key)
+        if task is None:
+            task = asyncio.create_task(self._lookup(key))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda t, key=key: self._refresh_done(key, t))
+        return task
+
+    async def _lookup(self, key: Tuple[str, int]) -> List[str]:
+        infos = await asyncio.get_running_loop().getaddrinfo(key[0], key[1], type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._entries[key] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def _refresh_done(self, key: Tuple[str, int], task: asyncio.Task):
+        self._refreshing.pop(key, None)
+        if not task.cancelled() and task.exception() is not None and key in self._entries:
+            # Keep serving the old addresses; the next lookup retries
+            logger.warning("DNS refresh for %s failed: %s", key[0], task.exception())
+
+
+class CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """httpcore network backend that connects to addresses from a DNSCache.
+
+    TLS still verifies and sends SNI for the original host name, because
+    httpcore passes the request host to start_tls separately.
+    """
+
+    def __init__(self, dns_cache: DNSCache, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+        self.dns_cache = dns_cache
+        self._backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if _is_ip(host):
+            return await self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+        last_error: Optional[Exception] = None
+        for address in await self.dns_cache.resolve(host, port):
+            try:
+                return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last_error = e
+        # Every cached address failed: resolve afresh next time
+        self.dns_cache.invalidate(host, port)
+        raise last_error or httpcore.ConnectError(f"No addresses for {host}")
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+
+def cached_transport(dns_cache: DNSCache, **kwargs) -> httpx.AsyncHTTPTransport:
+    """AsyncHTTPTransport whose connection pool resolves hosts through ``dns_cache``."""
+    transport = httpx.AsyncHTTPTransport(**kwargs)
+    # httpx 0.24 has no public hook for the network backend; the pool reads it on every new connection
+    transport._pool._network_backend = CachingNetworkBackend(dns_cache)
+    return transport
+
+
+class WarmHTTPXRequest(HTTPXRequest):
+    """Bot API request object with cached DNS and long-lived keep-alive connections."""
+
+    def __init__(self, dns_cache: DNSCache, *, keepalive_expiry: float = 60.0, **kwargs):
+        # HTTPXRequest builds its client in __init__, so these must be set first
+        self._dns_cache = dns_cache
+        self._keepalive_expiry = keepalive_expiry
+        super().__init__(**kwargs)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        kwargs = dict(self._client_kwargs)
+        if kwargs.get("proxies"):
+            return super()._build_client()
+        limits = kwargs.pop("limits")
+        limits = httpx.Limits(
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=self._keepalive_expiry,
+        )
+        transport = cached_transport(
+            self._dns_cache, limits=limits, http1=kwargs.pop("http1"), http2=kwargs.pop("http2")
+        )
+        kwargs.pop("proxies", None)
+        return httpx.AsyncClient(transport=transport, **kwargs)
+
+
+class KeepWarm:
+    """Runs warm-up pings at startup and then every ``interval`` seconds.
+
+    Each target is a coroutine function that opens (or reuses) pooled
+    connections, so idle pools never age out between user clicks.
+    ``status`` maps each target to whether its last ping succeeded;
+    ``warmed`` is true once every target has succeeded at least once.
+    """
+
+    def __init__(self, interval: float = 20.0, timeout: float = 10.0):
+        self.interval = interval
+        self.timeout = timeout
+        self._targets: List[Tuple[str, Callable[[], Awaitable[None]]]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.status: Dict[str, bool] = {}
+        self._reached: Set[str] = set()
+
+    @property
+    def warmed(self) -> bool:
+        return all(name in self._reached for name, _ in self._targets)
+
+    def add(self, name: str, ping: Callable[[], Awaitable[None]]):
+        self._targets.append((name, ping))
+
+    async def warm(self) -> Dict[str, bool]:
+        """Ping every target once; returns whether each one succeeded."""
+        results = await asyncio.gather(*(self._ping(name, ping) for name, ping in self._targets))
+        return {name: ok for (name, _), ok in zip(self._targets, results)}
+
+    def start(self):
+        if self.interval > 0 and self._targets:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.warm()
+
+    async def _ping(self, name: str, ping: Callable[[], Awaitable[None]]) -> bool:
+        try:
+            await asyncio.wait_for(ping(), self.timeout)
+        except Exception as e:
+            WARM_PINGS.labels(name, "error").inc()
+            logger.warning("Warm-up ping to %s failed: %s", name, e)
+            self.status[name] = False
+            return False
+        WARM_PINGS.labels(name, "ok").inc()
+        self.status[name] = True
+        self._reached.add(name)
+        return True
@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from copy import deepcopy
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from telegram.ext import BasePersistence, ContextTypes, PersistenceInput
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_WRITES = Counter(
+    "persistence_writes_total",
+    "Persistence entries by fate (written, deleted, unchanged when identical to the stored copy)",
+    ("result",),
+)
+PERSISTENCE_LOADS = Counter("persistence_loads_total", "Lazy user_data/chat_data loads by result (hit, miss)", ("result",))
+PERSISTENCE_FLUSH_SECONDS = Histogram("persistence_flush_duration_seconds", "Time to write one batch of dirty entries")
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS data (
+        kind TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        value BLOB NOT NULL,
+        PRIMARY KEY (kind, id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS conversations (
+        name TEXT NOT NULL,
+        key BLOB NOT NULL,
+        state BLOB NOT NULL,
+        PRIMARY KEY (name, key)
+    ) WITHOUT ROWID
+    """,
+)
+
+USER = "user"
+CHAT = "chat"
+BOT = "bot"
+CALLBACK = "callback"
+
+# Values bot_data may hold and still be persisted; services (clients, servers, monitors) are skipped
+_PLAIN_TYPES = (dict, list, tuple, set, frozenset, str, bytes, int, float, bool, type(None))
+
+
+class BotData(dict):
+    """bot_data that shares the process's services but only persists plain data.
+
+    The Application deep-copies bot_data before every persistence run; this
+    copy keeps entries holding builtin values and leaves out the clients,
+    servers and monitors post_init stores alongside them.
+    """
+
+    def __deepcopy__(self, memo):
+        return type(self)((key, deepcopy(value, memo)) for key, value in self.items() if type(value) in _PLAIN_TYPES)
+
+
+class LazyData(defaultdict):
+    """user_data/chat_data mapping that loads an entry from persistence the first time it is read.
+
+    LaneApplication loads an update's entries on a worker thread before
+    processing it, so this synchronous fallback only runs for entries read
+    outside an update (a job for a user who has not written since the restart).
+    """
+
+    def __init__(self, default_factory: Callable[[], Any], loader: Callable[[int], Any]):
+        super().__init__(default_factory)
+        self._loader = loader
+
+    def __missing__(self, key):
+        value = self._loader(key)
+        if value is None:
+            value = self.default_factory()
+        self[key] = value
+        return value
+
+
+class SQLitePersistence(BasePersistence):
+    """Persistence in an SQLite database (WAL) that writes only what changed.
+
+    The Application already hands over only the user and chat entries that
+    updates touched; entries whose pickle is identical to the stored copy
+    are skipped as well. Each persistence run's changes are written in one
+    transaction on a worker thread. Nothing is read at startup:
+    ``get_user_data`` and ``get_chat_data`` return empty mappings and
+    entries are loaded one primary-key lookup at a time by ``load_user_data``
+    and ``load_chat_data``, on a worker thread, before the first update from
+    that user or chat is processed (see dispatch.LaneApplication), so a
+    restart costs the same with ten users or ten million. Every user or chat
+    processed since the restart keeps an entry in memory, but entries that
+    are still empty are never written.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        store_data: Optional[PersistenceInput] = None,
+        update_interval: float = 60,
+        context_types: Optional[ContextTypes] = None,
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.path = path
+        self.context_types = context_types or ContextTypes()
+        # (table, kind or name, id or key) -> pickled bytes, or None to delete
+        self._pending: Dict[Tuple[str, Hashable, Any], Optional[bytes]] = {}
+        # hash of the last stored pickle, so unchanged entries are not rewritten
+        self._stored: Dict[Tuple[str, Any], int] = {}
+        self._writer: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        # Reads and batch writes each have a connection used from worker threads; WAL lets them overlap
+        self._read_lock = threading.Lock()
+        self._read_db: Optional[sqlite3.Connection] = None
+        self._write_db: Optional[sqlite3.Connection] = None
+
+    # Loading
+
+    async def get_user_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_bot_data(self) -> Any:
+        data = await asyncio.to_thread(self._load, BOT, 0)
+        return data if data is not None else self.context_types.bot_data()
+
+    async def get_callback_data(self):
+        return await asyncio.to_thread(self._load, CALLBACK, 0)
+
+    async def get_conversations(self, name: str):
+        rows = await asyncio.to_thread(self._read, "SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {pickle.loads(key): pickle.loads(state) for key, state in rows}
+
+    # Blocking; called from a worker thread
+    def load_user_data(self, user_id: int) -> Any:
+        return self._load(USER, user_id)
+
+    def load_chat_data(self, chat_id: int) -> Any:
+        return self._load(CHAT, chat_id)
+
+    def _load(self, kind: str, key: int) -> Any:
+        rows = self._read("SELECT value FROM data WHERE kind = ? AND id = ?", (kind, key))
+        row = rows[0] if rows else None
+        if kind in (USER, CHAT):
+            PERSISTENCE_LOADS.labels("hit" if row is not None else "miss").inc()
+        if row is None:
+            return None
+        self._stored[(kind, key)] = hash(row[0])
+        return pickle.loads(row[0])
+
+    # Saving
+
+    async def update_user_data(self, user_id: int, data: Any):
+        self._stage(USER, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Any):
+        self._stage(CHAT, chat_id, data)
+
+    async def update_bot_data(self, data: Any):
+        self._stage(BOT, 0, data)
+
+    async def update_callback_data(self, data: Any):
+        self._stage(CALLBACK, 0, data)
+
+    async def update_conversation(self, name: str, key, new_state):
+        key_bytes = pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+        state = None if new_state is None else pickle.dumps(new_state, pickle.HIGHEST_PROTOCOL)
+        self._pending[("conversations", name, key_bytes)] = state
+        self._schedule()
+
+    async def drop_user_data(self, user_id: int):
+        self._drop(USER, user_id)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._drop(CHAT, chat_id)
+
+    # Entries are live objects shared with the Application; there is nothing to refresh
+    async def refresh_user_data(self, user_id: int, user_data: Any):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any):
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any):
+        pass
+
+    async def flush(self):
+        if self._writer is not None:
+            await self._writer
+        await self._write_pending()
+        await asyncio.to_thread(self._close)
+
+    def _stage(self, kind: str, key: int, data: Any):
+        value = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        digest = hash(value)
+        previous = self._stored.get((kind, key))
+        # Unchanged, or a never-stored entry that is still empty (a user who never used user_data)
+        if previous == digest or (previous is None and not data):
+            PERSISTENCE_WRITES.labels("unchanged").inc()
+            return
+        self._stored[(kind, key)] = digest
+        self._pending[("data", kind, key)] = value
+        self._schedule()
+
+    def _drop(self, kind: str, key: int):
+        self._stored.pop((kind, key), None)
+        self._pending[("data", kind, key)] = None
+        self._schedule()
+
+    def _schedule(self):
+        # update_persistence calls every update_* concurrently; write them all in one transaction
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_soon())
+
+    async def _write_soon(self):
+        try:
+            await asyncio.sleep(0)
+            await self._write_pending()
+        finally:
+            self._writer = None
+
+    async def _write_pending(self):
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                elapsed = await asyncio.to_thread(self._write, batch)
+            except sqlite3.Error as e:
+                logger.error("Failed to persist %d entries to %s: %s", len(batch), self.path, e)
+                # Keep newer changes staged meanwhile; retry the rest with the next run
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)
+                for table, kind, key in batch:
+                    if table == "data":
+                        self._stored.pop((kind, key), None)
+                return
+            PERSISTENCE_FLUSH_SECONDS.observe(elapsed)
+
+    # SQLite
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            db.execute(statement)
+        return db
+
+    def _read(self, sql: str, parameters: tuple) -> list:
+        with self._read_lock:
+            if self._read_db is None:
+                self._read_db = self._connect()
+            return self._read_db.execute(sql, parameters).fetchall()
+
+    def _write(self, batch: Dict[Tuple[str, Hashable, Any], Optional[bytes]]) -> float:
+        with self._write_lock:
+            if self._write_db is None:
+                self._write_db = self._connect()
+            db = self._write_db
+            started = time.perf_counter()
+            upserts, deletes = {"data": [], "conversations": []}, {"data": [], "conversations": []}
+            for (table, kind, key), value in batch.items():
+                if value is None:
+                    deletes[table].append((kind, key))
+                else:
+                    upserts[table].append((kind, key, value))
+            db.execute("BEGIN")
+            try:
+                db.executemany("INSERT OR REPLACE INTO data (kind, id, value) VALUES (?, ?, ?)", upserts["data"])
+                db.executemany("DELETE FROM data WHERE kind = ? AND id = ?", deletes["data"])
+                db.executemany(
+                    "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)", upserts["conversations"]
+                )
+                db.executemany("DELETE FROM conversations WHERE name = ? AND key = ?", deletes["conversations"])
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            PERSISTENCE_WRITES.labels("written").inc(len(upserts["data"]) + len(upserts["conversations"]))
+            PERSISTENCE_WRITES.labels("deleted").inc(len(deletes["data"]) + len(deletes["conversations"]))
+            return time.perf_counter() - started
+
+    def _close(self):
+        with self._write_lock:
+            if self._write_db is not None:
+                self._write_db.close()
+                self._write_db = None
+        with self._read_lock:
+            if self._read_db is not None:
+                self._read_db.close()
+                self._read_db = None
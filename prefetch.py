@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from adsgram import AdResult, FILLED
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_STARTED = Counter("ads_prefetch_started_total", "Speculative AdsGram fetches started from /start")
+PREFETCH_LOOKUPS = Counter(
+    "ads_prefetch_lookups_total",
+    "show_ads lookups in the prefetch cache by result (hit, miss, expired, unusable)",
+    ("result",),
+)
+PREFETCH_WASTED = Counter(
+    "ads_prefetch_wasted_total",
+    "Prefetched ads that were never shown, by reason",
+    ("reason",),
+)
+
+
+class Prefetcher:
+    """Per-user cache of speculative AdsGram fetches started by /start."""
+
+    def __init__(
+        self,
+        fetch: Callable[[int], Awaitable[AdResult]],
+        *,
+        ttl: float = 30.0,
+        max_entries: int = 10000,
+    ):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # telegram_id -> (expires_at, task), oldest first
+        self._entries: "OrderedDict[int, Tuple[float, asyncio.Task]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def prefetch(self, telegram_id: int):
+        now = time.monotonic()
+        self._expire(now)
+
+        if telegram_id in self._entries:
+            return
+        while len(self._entries) >= self.max_entries:
+            _, (_, task) = self._entries.popitem(last=False)
+            self._discard(task, "evicted")
+
+        task = asyncio.create_task(self._fetch(telegram_id))
+        self._entries[telegram_id] = (now + self.ttl, task)
+        PREFETCH_STARTED.inc()
+
+    async def take(self, telegram_id: int) -> Optional[AdResult]:
+        entry = self._entries.pop(telegram_id, None)
+        if entry is None:
+            PREFETCH_LOOKUPS.labels("miss").inc()
+            return None
+
+        expires_at, task = entry
+        if time.monotonic() >= expires_at:
+            PREFETCH_LOOKUPS.labels("expired").inc()
+            self._discard(task, "expired")
+            return None
+
+        # A fetch still in flight is a hit too: the round trip is already under way
+        result = await task
+        if result.outcome != FILLED:
+            PREFETCH_LOOKUPS.labels("unusable").inc()
+            return None
+
+        PREFETCH_LOOKUPS.labels("hit").inc()
+        return result
+
+    async def close(self):
+        tasks = []
+        while self._entries:
+            _, (_, task) = self._entries.popitem(last=False)
+            self._discard(task, "shutdown")
+            tasks.append(task)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _expire(self, now: float):
+        # All entries share one TTL, so insertion order is expiry order
+        while self._entries:
+            telegram_id, (expires_at, task) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[telegram_id]
+            self._discard(task, "expired")
+
+    def _discard(self, task: asyncio.Task, reason: str):
+        if not task.done():
+            task.cancel()
+        PREFETCH_WASTED.labels(reason).inc()
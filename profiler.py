@@ -0,0 +1,158 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from metrics import Counter as MetricCounter
+
+PROFILES_TAKEN = MetricCounter("profiler_runs_total", "Sampling profiler runs")
+
+# Leaf functions where the event loop thread is waiting for I/O rather than running code
+_IDLE_FUNCTIONS = {"select", "poll", "epoll", "kqueue", "control"}
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename
+    if path.startswith(_ROOT):
+        path = os.path.relpath(path, _ROOT)
+    else:
+        # Library frames: keep the package-relative tail
+        parts = path.replace("\\", "/").split("/")
+        if "site-packages" in parts:
+            path = "/".join(parts[parts.index("site-packages") + 1 :])
+        else:
+            path = "/".join(parts[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+@dataclass
+class Profile:
+    duration: float
+    interval: float
+    samples: int = 0
+    # collapsed stack ("thread;outer;...;leaf") -> samples
+    stacks: Counter = field(default_factory=Counter)
+    # event loop thread only
+    loop_samples: int = 0
+    loop_idle: int = 0
+    loop_self: Counter = field(default_factory=Counter)
+    loop_total: Counter = field(default_factory=Counter)
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format, readable by flamegraph.pl, speedscope and inferno."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = 10) -> str:
+        busy = self.loop_samples - self.loop_idle
+        lines = [
+            f"{self.samples} samples over {self.duration:.1f}s (every {self.interval * 1000:.0f}ms)",
+            f"Event loop busy {busy / max(1, self.loop_samples):.0%} of samples",
+        ]
+        if busy:
+            lines.append("")
+            lines.append("Top self time on the loop thread:")
+            lines += [f"{count / busy:6.1%}  {frame}" for frame, count in self.loop_self.most_common(top)]
+            lines.append("")
+            lines.append("Top total time on the loop thread:")
+            lines += [f"{count / busy:6.1%}  {frame}" for frame, count in self.loop_total.most_common(top)]
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """Samples every thread's Python stack with sys._current_frames() from a background thread.
+
+    Nothing is installed in the profiled code, so the cost is one stack walk
+    per thread per ``interval``, paid by the sampling thread holding the GIL.
+    """
+
+    def __init__(self, interval: float = 0.005, loop_thread_id: Optional[int] = None):
+        self.interval = interval
+        self.loop_thread_id = loop_thread_id if loop_thread_id is not None else threading.main_thread().ident
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, duration: float) -> Profile:
+        """Sample for ``duration`` seconds; blocks, so call it from a worker thread."""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            PROFILES_TAKEN.inc()
+            return self._sample(duration)
+        finally:
+            self._lock.release()
+
+    def _sample(self, duration: float) -> Profile:
+        profile = Profile(duration=duration, interval=self.interval)
+        me = threading.get_ident()
+        labels: Dict[object, str] = {}
+        names = {t.ident: t.name for t in threading.enumerate()}
+
+        deadline = time.monotonic() + duration
+        next_sample = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if now < next_sample:
+                time.sleep(next_sample - now)
+            next_sample += self.interval
+
+            profile.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.reverse()
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                thread = names.get(thread_id, str(thread_id))
+                profile.stacks[";".join([thread] + stack)] += 1
+
+                if thread_id == self.loop_thread_id and stack:
+                    self._count_loop(profile, stack)
+        return profile
+
+    @staticmethod
+    def _count_loop(profile: Profile, stack: List[str]):
+        profile.loop_samples += 1
+        leaf = stack[-1]
+        if leaf.split(" ", 1)[0] in _IDLE_FUNCTIONS:
+            profile.loop_idle += 1
+            return
+        profile.loop_self[leaf] += 1
+        # Frames above the running callback (asyncio.run, run_forever, ...) are in every sample
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i].startswith("_run (asyncio/events.py"):
+                stack = stack[i + 1 :]
+                break
+        for frame in set(stack):
+            profile.loop_total[frame] += 1
+
+
+def write_profile(profile: Profile, directory: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profile.collapsed())
+    return path
+
+
+def profile_to_file(profiler: SamplingProfiler, duration: float, directory: str) -> Tuple[Profile, str]:
+    """Run a profile and write it to ``directory``; meant for asyncio.to_thread."""
+    profile = profiler.run(duration)
+    return profile, write_profile(profile, directory)
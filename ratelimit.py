@@ -0,0 +1,246 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import tracing
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+SEND_QUEUE_DEPTH = Gauge("telegram_send_queue_depth", "Bot API requests waiting for a rate limit slot")
+SEND_WAIT_SECONDS = Histogram(
+    "telegram_send_wait_seconds",
+    "Time Bot API requests spent waiting in the outbound scheduler",
+    ("endpoint",),
+)
+API_CALL_SECONDS = Histogram(
+    "telegram_api_duration_seconds",
+    "Bot API call latency by endpoint, excluding time spent waiting for a rate limit slot",
+    ("endpoint",),
+)
+RETRY_AFTER = Counter("telegram_retry_after_total", "429 RetryAfter responses from the Bot API", ("endpoint",))
+PAUSED_CHATS = Gauge("telegram_paused_chats", "Chats paused after a RetryAfter")
+
+# Lower runs first: callback answers stop the client spinner, edits update what the user looks at
+PRIORITY_ANSWER = 0
+PRIORITY_EDIT = 1
+PRIORITY_DEFAULT = 2
+
+ENDPOINT_PRIORITIES = {
+    "answerCallbackQuery": PRIORITY_ANSWER,
+    "answerInlineQuery": PRIORITY_ANSWER,
+    "editMessageText": PRIORITY_EDIT,
+    "editMessageReplyMarkup": PRIORITY_EDIT,
+    "editMessageCaption": PRIORITY_EDIT,
+}
+
+
+class TokenBucket:
+    """Reservation-style token bucket: callers take a token now and are told how long to wait."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1.0
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_take(self) -> float:
+        """Take a token if one is available; otherwise return the wait until one is."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def is_idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class FloodLimiter(BaseRateLimiter[int]):
+    """Outbound scheduler enforcing Telegram's global and per-chat flood limits.
+
+    Each request first waits for its chat's bucket (and any RetryAfter pause
+    on that chat), then for a slot in the global bucket. Global slots are
+    handed out by priority, so callback answers overtake queued sends.
+    """
+
+    def __init__(
+        self,
+        *,
+        global_rate: float = 30.0,
+        private_chat_rate: float = 1.0,
+        private_chat_burst: float = 3.0,
+        group_chat_rate: float = 20 / 60,
+        group_chat_burst: float = 3.0,
+        max_retries: int = 3,
+        max_chat_buckets: int = 100000,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_chat_rate = private_chat_rate
+        self.private_chat_burst = private_chat_burst
+        self.group_chat_rate = group_chat_rate
+        self.group_chat_burst = group_chat_burst
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+
+        self._chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+        self._paused_until: Dict[Union[int, str], float] = {}
+        # (priority, sequence, future) waiting for a global slot
+        self._waiting: List[tuple] = []
+        self._sequence = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        self.queue_depth = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._pump_task
+            self._pump_task = None
+        for _, _, future in self._waiting:
+            future.cancel()
+        self._waiting.clear()
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+        priority = ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_DEFAULT)
+        chat_id = data.get("chat_id")
+        with contextlib.suppress(ValueError, TypeError):
+            chat_id = int(chat_id)
+
+        for attempt in range(max_retries + 1):
+            with tracing.span(endpoint, tracing.CLIENT, peer="telegram", attempt=attempt) as span:
+                started = time.monotonic()
+                self._enter_queue()
+                try:
+                    if chat_id is not None:
+                        await self._wait_for_chat(chat_id)
+                    await self._wait_for_global(priority)
+                finally:
+                    self._leave_queue()
+                sent = time.monotonic()
+                SEND_WAIT_SECONDS.labels(endpoint).observe(sent - started)
+                if span is not None:
+                    span.set_tag("rate_limit_wait_ms", round((sent - started) * 1000, 3))
+
+                try:
+                    try:
+                        return await callback(*args, **kwargs)
+                    finally:
+                        API_CALL_SECONDS.labels(endpoint).observe(time.monotonic() - sent)
+                except RetryAfter as e:
+                    RETRY_AFTER.labels(endpoint).inc()
+                    if attempt == max_retries:
+                        logger.error("Rate limited on %s after %d retries", endpoint, max_retries)
+                        raise
+                    delay = float(e.retry_after) + 0.1
+                    if span is not None:
+                        span.set_tag("retry_after", e.retry_after)
+                    if chat_id is not None:
+                        # Only the affected chat waits; everyone else keeps sending
+                        self._pause_chat(chat_id, delay)
+                    else:
+                        await asyncio.sleep(delay)
+                    logger.warning("RetryAfter on %s (chat %s), retrying in %.1fs", endpoint, chat_id, delay)
+
+    def _enter_queue(self):
+        self.queue_depth += 1
+        SEND_QUEUE_DEPTH.set(self.queue_depth)
+
+    def _leave_queue(self):
+        self.queue_depth -= 1
+        SEND_QUEUE_DEPTH.set(self.queue_depth)
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                self._prune_chat_buckets()
+            # Negative ids and @usernames are groups or channels, which have a lower limit
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(self.group_chat_rate, self.group_chat_burst)
+            else:
+                bucket = TokenBucket(self.private_chat_rate, self.private_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_chat_buckets(self):
+        # Full buckets carry no state worth keeping
+        for chat_id in [c for c, b in self._chat_buckets.items() if b.is_idle()]:
+            del self._chat_buckets[chat_id]
+
+    def _pause_chat(self, chat_id: Union[int, str], delay: float):
+        until = time.monotonic() + delay
+        if until > self._paused_until.get(chat_id, 0.0):
+            self._paused_until[chat_id] = until
+        PAUSED_CHATS.set(len(self._paused_until))
+
+    async def _wait_for_chat(self, chat_id: Union[int, str]):
+        paused_until = self._paused_until.get(chat_id)
+        if paused_until is not None:
+            delay = paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._paused_until.get(chat_id, 0.0) <= time.monotonic():
+                self._paused_until.pop(chat_id, None)
+                PAUSED_CHATS.set(len(self._paused_until))
+
+        delay = self._chat_bucket(chat_id).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _wait_for_global(self, priority: int):
+        if not self._waiting and self.global_bucket.try_take() == 0.0:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._sequence), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self):
+        # Hand out global slots to waiting requests, highest priority first
+        while self._waiting:
+            delay = self.global_bucket.try_take()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                # The waiter was cancelled; give the slot to the next one
+                self.global_bucket.tokens += 1.0
+                continue
+            future.set_result(None)
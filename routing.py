@@ -0,0 +1,87 @@
+import random
+from array import array
+from typing import List, Sequence
+
+from metrics import Counter, Gauge
+
+BLOCK_FILL_RATE = Gauge("adsgram_block_fill_rate", "Smoothed fill rate per AdsGram block", ("block",))
+BLOCK_ERROR_RATE = Gauge("adsgram_block_error_rate", "Smoothed error rate per AdsGram block", ("block",))
+BLOCK_LATENCY = Gauge("adsgram_block_latency_seconds", "Smoothed latency per AdsGram block", ("block",))
+BLOCK_FAILOVERS = Counter(
+    "adsgram_block_failovers_total",
+    "Requests that moved on to another block after an empty fill",
+    ("block",),
+)
+
+
+class BlockRouter:
+    """Orders AdsGram blocks for each request by their recent fill rate, latency and errors.
+
+    Statistics are exponentially weighted moving averages kept in flat arrays
+    indexed by block position, so recording an outcome is a few float updates.
+    """
+
+    def __init__(
+        self,
+        block_ids: Sequence[str],
+        *,
+        alpha: float = 0.1,
+        latency_reference: float = 0.5,
+        min_score: float = 0.02,
+    ):
+        if not block_ids:
+            raise ValueError("At least one AdsGram block is required")
+        self.block_ids = list(block_ids)
+        self.alpha = alpha
+        self.latency_reference = latency_reference
+        self.min_score = min_score
+
+        count = len(self.block_ids)
+        # Optimistic priors so new blocks get traffic before they have history
+        self._fill = array("d", [1.0] * count)
+        self._errors = array("d", [0.0] * count)
+        self._latency = array("d", [0.0] * count)
+        self._single = [0] if count == 1 else None
+
+        self._fill_gauges = [BLOCK_FILL_RATE.labels(b) for b in self.block_ids]
+        self._error_gauges = [BLOCK_ERROR_RATE.labels(b) for b in self.block_ids]
+        self._latency_gauges = [BLOCK_LATENCY.labels(b) for b in self.block_ids]
+        self._failovers = [BLOCK_FAILOVERS.labels(b) for b in self.block_ids]
+
+    def score(self, index: int) -> float:
+        score = (
+            self._fill[index]
+            * (1.0 - self._errors[index])
+            / (1.0 + self._latency[index] / self.latency_reference)
+        )
+        return max(self.min_score, score)
+
+    def order(self) -> List[int]:
+        """Block indexes to try for one request: a weighted pick first, then the rest by score."""
+        if self._single is not None:
+            return self._single
+
+        scores = [self.score(i) for i in range(len(self.block_ids))]
+        pick = random.random() * sum(scores)
+        first = len(scores) - 1
+        for i, score in enumerate(scores):
+            pick -= score
+            if pick <= 0:
+                first = i
+                break
+        rest = sorted((i for i in range(len(scores)) if i != first), key=scores.__getitem__, reverse=True)
+        return [first] + rest
+
+    def record(self, index: int, filled: bool, failed: bool, latency: float):
+        a = self.alpha
+        if not failed:
+            self._fill[index] += a * ((1.0 if filled else 0.0) - self._fill[index])
+        self._errors[index] += a * ((1.0 if failed else 0.0) - self._errors[index])
+        self._latency[index] += a * (latency - self._latency[index])
+
+        self._fill_gauges[index].set(self._fill[index])
+        self._error_gauges[index].set(self._errors[index])
+        self._latency_gauges[index].set(self._latency[index])
+
+    def record_failover(self, index: int):
+        self._failovers[index].inc()
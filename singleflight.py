@@ -0,0 +1,76 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from metrics import Counter
+
+SINGLEFLIGHT_CALLS = Counter(
+    "singleflight_calls_total",
+    "Single-flight calls by group and role (leader runs the call, follower shares it)",
+    ("group", "role"),
+)
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one in-flight call.
+
+    With ``linger`` set, a finished result is also shared with calls for the
+    same key that arrive within ``linger`` seconds after it completed. The
+    show_ads taps in button_handler are deduplicated by that linger path:
+    LaneApplication runs one user's updates one at a time, so a repeated tap
+    only arrives after the first one's call has finished.
+    """
+
+    def __init__(self, name: str, linger: float = 0.0):
+        self.name = name
+        self.linger = linger
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # key -> (expires_at, result), oldest first
+        self._recent: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._leaders = SINGLEFLIGHT_CALLS.labels(name, "leader")
+        self._followers = SINGLEFLIGHT_CALLS.labels(name, "follower")
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run ``fn`` unless a call for ``key`` is already running; returns (result, shared)."""
+        future = self._inflight.get(key)
+        if future is not None:
+            self._followers.inc()
+            return await asyncio.shield(future), True
+
+        if self._recent:
+            now = time.monotonic()
+            while self._recent:
+                oldest, (expires_at, _) = next(iter(self._recent.items()))
+                if expires_at > now:
+                    break
+                del self._recent[oldest]
+            recent = self._recent.get(key)
+            if recent is not None:
+                self._followers.inc()
+                return recent[1], True
+
+        self._leaders.inc()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            if self.linger > 0:
+                self._recent[key] = (time.monotonic() + self.linger, result)
+                self._recent.move_to_end(key)
+            return result, False
+        finally:
+            del self._inflight[key]
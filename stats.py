@@ -0,0 +1,239 @@
+import math
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from adsgram import AdResult, CANCELLED, CIRCUIT_OPEN, EXCEPTION, FILLED, HTTP_ERROR, NO_FILL
+
+ALL = "all"
+
+# Log-bucket sketch: every quantile is within RELATIVE_ACCURACY of the true
+# value for latencies between MIN_LATENCY and MAX_LATENCY seconds
+RELATIVE_ACCURACY = 0.02
+MIN_LATENCY = 1e-4
+MAX_LATENCY = 120.0
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_BUCKETS = math.ceil(math.log(MAX_LATENCY / MIN_LATENCY) / _LOG_GAMMA) + 1
+
+
+def sketch_bucket(seconds: float) -> int:
+    if seconds <= MIN_LATENCY:
+        return 0
+    return min(_BUCKETS - 1, math.ceil(math.log(seconds / MIN_LATENCY) / _LOG_GAMMA))
+
+
+class LatencySketch:
+    """Fixed-size log-bucket latency sketch; sketches merge and subtract by adding counts."""
+
+    __slots__ = ("counts", "count")
+
+    def __init__(self):
+        self.counts = array("q", bytes(8 * _BUCKETS))
+        self.count = 0
+
+    def add(self, bucket: int):
+        self.counts[bucket] += 1
+        self.count += 1
+
+    def merge(self, other: "LatencySketch"):
+        counts = self.counts
+        for i, n in enumerate(other.counts):
+            if n:
+                counts[i] += n
+        self.count += other.count
+
+    def subtract(self, other: "LatencySketch"):
+        counts = self.counts
+        for i, n in enumerate(other.counts):
+            if n:
+                counts[i] -= n
+        self.count -= other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen > rank:
+                # Midpoint of the bucket in relative terms
+                return MIN_LATENCY * _GAMMA**i * 2 / (1 + _GAMMA)
+        return MAX_LATENCY
+
+
+class Aggregate:
+    __slots__ = ("outcomes", "latency")
+
+    def __init__(self):
+        self.outcomes: Dict[str, int] = {}
+        self.latency = LatencySketch()
+
+    @property
+    def requests(self) -> int:
+        return sum(self.outcomes.values())
+
+    def add(self, outcome: str, bucket: Optional[int]):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if bucket is not None:
+            self.latency.add(bucket)
+
+    def merge(self, other: "Aggregate"):
+        for outcome, n in other.outcomes.items():
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + n
+        self.latency.merge(other.latency)
+
+    def subtract(self, other: "Aggregate"):
+        for outcome, n in other.outcomes.items():
+            self.outcomes[outcome] -= n
+        self.latency.subtract(other.latency)
+
+
+class _Window:
+    """A span of time split into fixed-width slots, plus the running sum of the live slots."""
+
+    def __init__(self, span: float, buckets: int):
+        self.span = span
+        self.width = span / buckets
+        self.slots: List[Dict[str, Aggregate]] = [{} for _ in range(buckets)]
+        self.totals: Dict[str, Aggregate] = {}
+        self.current: Optional[int] = None
+
+    def advance(self, now: float):
+        index = int(now // self.width)
+        if self.current is None:
+            self.current = index
+            return
+        # Slots that fall out of the window leave the totals as they are reused
+        for step in range(1, min(index - self.current, len(self.slots)) + 1):
+            slot = self.slots[(self.current + step) % len(self.slots)]
+            for key, aggregate in slot.items():
+                self.totals[key].subtract(aggregate)
+            slot.clear()
+        self.current = max(self.current, index)
+
+    def add(self, key: str, aggregate: Aggregate):
+        slot = self.slots[self.current % len(self.slots)]
+        for target in (slot, self.totals):
+            existing = target.get(key)
+            if existing is None:
+                existing = target[key] = Aggregate()
+            existing.merge(aggregate)
+
+
+def window_label(seconds: float) -> str:
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{int(seconds // size)}{unit}"
+    return f"{seconds:g}s"
+
+
+class RollingStats:
+    """Ad outcomes and AdsGram latency over rolling windows, overall and per block.
+
+    The overall figures count what users were shown (``record``, once per
+    ad request); the per-block ones count every block AdsGram was asked for
+    (``record_attempt``), so failovers and unshown prefetches are charged to
+    the block that answered them.
+    Outcomes are counted into one short slot per key; when that slot closes
+    it is merged into every window. Each window keeps ``buckets`` fixed-width
+    slots and a running total that slots are merged into as they close and
+    subtracted from as they expire, so recording costs two counter updates
+    and reading a window costs the same however much traffic it covered.
+    Windows are accurate to one slot width (a 5m window with 60 slots moves in 5s steps).
+    """
+
+    def __init__(self, windows: Sequence[float] = (300, 3600, 86400), buckets: int = 60):
+        self.windows = [_Window(span, buckets) for span in windows]
+        self.resolution = min(window.width for window in self.windows)
+        self._current: Dict[str, Aggregate] = {}
+        self._slot: Optional[int] = None
+
+    def record(self, result: AdResult, now: Optional[float] = None):
+        self._add(ALL, result, now)
+
+    def record_attempt(self, result: AdResult, now: Optional[float] = None):
+        # Abandoned attempts got no answer and negative-cache hits never reached AdsGram
+        if result.block_id and result.outcome != CANCELLED and not result.cached:
+            self._add(result.block_id, result, now)
+
+    def _add(self, key: str, result: AdResult, now: Optional[float]):
+        self._rotate(time.monotonic() if now is None else now)
+        # Only answers that actually came from AdsGram count towards latency
+        if result.cached or result.outcome == CIRCUIT_OPEN or result.latency <= 0:
+            bucket = None
+        else:
+            bucket = sketch_bucket(result.latency)
+        aggregate = self._current.get(key)
+        if aggregate is None:
+            aggregate = self._current[key] = Aggregate()
+        aggregate.add(result.outcome, bucket)
+
+    def totals(self, span: float, now: Optional[float] = None) -> Dict[str, Aggregate]:
+        """Per-key aggregates for the window of ``span`` seconds, including the open slot."""
+        now = time.monotonic() if now is None else now
+        self._rotate(now)
+        for window in self.windows:
+            if window.span == span:
+                window.advance(now)
+                totals = {}
+                for source in (window.totals, self._current):
+                    for key, aggregate in source.items():
+                        total = totals.get(key)
+                        if total is None:
+                            total = totals[key] = Aggregate()
+                        total.merge(aggregate)
+                return totals
+        raise KeyError(span)
+
+    def report(self, now: Optional[float] = None) -> str:
+        now = time.monotonic() if now is None else now
+        lines = []
+        for window in self.windows:
+            lines.append(f"Last {window_label(window.span)}:")
+            totals = self.totals(window.span, now)
+            keys = [ALL] + sorted(key for key in totals if key != ALL)
+            for key in keys:
+                aggregate = totals.get(key)
+                if aggregate is None or not aggregate.requests:
+                    if key == ALL:
+                        lines.append("  no ad requests")
+                    continue
+                lines.append(f"  {key}: {_describe(aggregate)}")
+            lines.append("")
+        return "\n".join(lines).rstrip()
+
+    def _rotate(self, now: float):
+        index = int(now // self.resolution)
+        if self._slot is None:
+            self._slot = index
+        if index <= self._slot:
+            return
+        closed_at = self._slot * self.resolution
+        for window in self.windows:
+            window.advance(closed_at)
+            for key, aggregate in self._current.items():
+                window.add(key, aggregate)
+        self._current = {}
+        self._slot = index
+
+
+def _describe(aggregate: Aggregate) -> str:
+    outcomes = aggregate.outcomes
+    requests = aggregate.requests
+    filled = outcomes.get(FILLED, 0)
+    errors = outcomes.get(HTTP_ERROR, 0) + outcomes.get(EXCEPTION, 0)
+    parts = [
+        f"{requests} requests",
+        f"fill {filled / requests:.1%}",
+        f"no fill {outcomes.get(NO_FILL, 0)}",
+        f"errors {errors}",
+    ]
+    if outcomes.get(CIRCUIT_OPEN):
+        parts.append(f"circuit open {outcomes[CIRCUIT_OPEN]}")
+    p50 = aggregate.latency.quantile(0.5)
+    if p50 is not None:
+        parts.append(f"p50 {p50 * 1000:.0f}ms")
+        parts.append(f"p95 {aggregate.latency.quantile(0.95) * 1000:.0f}ms")
+    return ", ".join(parts)
@@ -0,0 +1,20 @@
+import asyncio
+import os
+
+from adsgram import AdResult, NO_FILL
+from eventlog import COLUMNAR_SUFFIX, EventLog, read_segment
+
+
+def test_cached_no_fill_round_trips_apart_from_a_real_one(tmp_path):
+    async def write():
+        events = EventLog(str(tmp_path))
+        await events.start()
+        events.log_ad(1, AdResult(NO_FILL, block_id="b1", status_code=200, latency=0.05))
+        events.log_ad(1, AdResult(NO_FILL, block_id="b1", cached=True))
+        await events.close()
+
+    asyncio.run(write())
+    [name] = [name for name in os.listdir(tmp_path) if name.endswith(COLUMNAR_SUFFIX)]
+    columns = read_segment(os.path.join(tmp_path, name))
+    assert columns["outcome"] == [NO_FILL, NO_FILL]
+    assert columns["detail"] == ["", "cached"]
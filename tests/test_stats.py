@@ -0,0 +1,14 @@
+from adsgram import AdResult, CANCELLED, FILLED, NO_FILL
+from stats import ALL, RollingStats
+
+
+def test_record_attempt_counts_only_requests_sent_to_adsgram():
+    stats = RollingStats()
+    stats.record_attempt(AdResult(NO_FILL, block_id="b1", latency=0.05), now=0)
+    stats.record_attempt(AdResult(FILLED, block_id="b1", url="u", latency=0.05), now=0)
+    stats.record_attempt(AdResult(NO_FILL, block_id="b1", cached=True), now=0)
+    stats.record_attempt(AdResult(CANCELLED, block_id="b1", latency=0.01), now=0)
+
+    totals = stats.totals(300, now=1)
+    assert totals["b1"].outcomes == {NO_FILL: 1, FILLED: 1}
+    assert ALL not in totals
@@ -0,0 +1,359 @@
+"""Load generator for the /start -> show_ads funnel.
+
+Builds the real Application from bot.py, swaps its network edges for
+in-memory fakes (an httpx MockTransport for AdsGram and a BaseRequest that
+answers Bot API calls locally), then feeds synthetic Update objects for N
+simulated users through the real start and button_handler coroutines.
+
+The Application is initialized but never started, so process_update runs
+each update inline rather than through LaneApplication's per-user lanes:
+the numbers cover the handlers and their upstream calls, not lane queueing.
+
+    python -m tools.bench_funnel --users 5000 --concurrency 200 --output result.json
+    python -m tools.bench_funnel --save-baseline tools/bench_baseline.json
+    python -m tools.bench_funnel --baseline tools/bench_baseline.json
+
+With --baseline the run exits non-zero when throughput, latency or loop lag
+regress beyond --tolerance, so a blocking call in a handler shows up as a
+number rather than a hunch.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("BLOCK_ID", "bench")
+# The benchmark measures the bot, not Telegram's flood limits
+os.environ.setdefault("TELEGRAM_GLOBAL_RATE", "1000000")
+os.environ.setdefault("TELEGRAM_CHAT_RATE", "1000000")
+# post_init starts the bot's HTTP servers; keep them off fixed ports
+os.environ.setdefault("PORT", "0")
+os.environ.setdefault("METRICS_PORT", "0")
+# The AdsGram transport is swapped for the mock only after post_init, whose warm-up would hit the real API
+os.environ.setdefault("ADSGRAM_WARM_CONNECTIONS", "0")
+# Keep the user registry off disk so runs leave nothing behind
+os.environ.setdefault("USERS_DB", ":memory:")
+# Ad events go to a scratch directory, removed again when the run ends
+SCRATCH_EVENTS_DIR: Optional[str] = None
+if "EVENTS_DIR" not in os.environ:
+    SCRATCH_EVENTS_DIR = os.environ["EVENTS_DIR"] = tempfile.mkdtemp(prefix="bench-events-")
+
+from telegram import Update  # noqa: E402
+from telegram.request import BaseRequest, RequestData  # noqa: E402
+
+import bot  # noqa: E402
+from http_server import Request  # noqa: E402
+from tools.fake_adsgram import sample_latency  # noqa: E402
+from tools.fake_telegram import FakeTelegram  # noqa: E402
+
+logger = logging.getLogger("bench_funnel")
+
+HISTOGRAM_BOUNDS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# metric -> True when higher is better
+COMPARED = {
+    "updates_per_second": True,
+    "start_p99_ms": False,
+    "show_ads_p99_ms": False,
+    "loop_lag_p99_ms": False,
+    "retained_bytes_per_update": False,
+}
+
+
+class InMemoryBotRequest(BaseRequest):
+    """BaseRequest that answers Bot API calls from a FakeTelegram without any I/O."""
+
+    def __init__(self, telegram: FakeTelegram):
+        self.telegram = telegram
+        self._endpoints: Dict[str, object] = {}
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> Tuple[int, bytes]:
+        endpoint = urlsplit(url).path.rsplit("/", 1)[-1]
+        handler = self._endpoints.get(endpoint)
+        if handler is None:
+            handler = self._endpoints[endpoint] = self.telegram._endpoint(endpoint)
+        body = request_data.url_encoded_parameters().encode() if request_data else b""
+        request = Request(
+            "POST", endpoint, {}, {"content-type": "application/x-www-form-urlencoded"}, body
+        )
+        response = await handler(request)
+        return response.status, response.body
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def histogram(values_ms: List[float]) -> Dict[str, int]:
+    counts = {f"le_{bound}": 0 for bound in HISTOGRAM_BOUNDS_MS}
+    counts["le_inf"] = 0
+    for value in values_ms:
+        for bound in HISTOGRAM_BOUNDS_MS:
+            if value <= bound:
+                counts[f"le_{bound}"] += 1
+                break
+        else:
+            counts["le_inf"] += 1
+    return counts
+
+
+class Funnel:
+    def __init__(self, application, telegram: FakeTelegram, think: float, seed: int):
+        self.application = application
+        self.telegram = telegram
+        self.think = think
+        self.rng = random.Random(seed)
+        self.latencies: Dict[str, List[float]] = {"start": [], "show_ads": []}
+        self.updates = 0
+        self._update_id = 0
+        self._last_reply: Dict[int, dict] = {}
+        telegram.listeners.append(self._on_bot_call)
+
+    def _on_bot_call(self, method: str, params: dict, result):
+        if method == "sendMessage":
+            self._last_reply[int(params["chat_id"])] = result
+
+    def _next_update_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+
+    async def _process(self, kind: str, data: dict):
+        update = Update.de_json(data, self.application.bot)
+        started = time.perf_counter()
+        await self.application.process_update(update)
+        self.latencies[kind].append(time.perf_counter() - started)
+        self.updates += 1
+
+    async def user(self, user_id: int):
+        user = self.telegram.new_user(user_id)
+        chat = {"id": user_id, "type": "private"}
+        await self._process(
+            "start",
+            {
+                "update_id": self._next_update_id(),
+                "message": {
+                    "message_id": 1,
+                    "date": int(time.time()),
+                    "chat": chat,
+                    "from": user,
+                    "text": "/start",
+                    "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+                },
+            },
+        )
+        if self.think:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+
+        message = self._last_reply.pop(user_id, None)
+        if message is None:
+            return
+        await self._process(
+            "show_ads",
+            {
+                "update_id": self._next_update_id(),
+                "callback_query": {
+                    "id": str(self._update_id),
+                    "from": user,
+                    "message": message,
+                    "chat_instance": str(user_id),
+                    "data": "show_ads",
+                },
+            },
+        )
+
+
+async def run(args) -> dict:
+    telegram = FakeTelegram(bot.BOT_TOKEN, latency=args.telegram_latency, seed=args.seed)
+    application = bot.build_application(request=InMemoryBotRequest(telegram))
+
+    rng = random.Random(args.seed)
+
+    async def adsgram(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(sample_latency(args.adsgram_latency, rng))
+        if rng.random() < args.fill_rate:
+            return httpx.Response(200, json={"url": "https://example.invalid/ad"})
+        return httpx.Response(200, json={})
+
+    await application.initialize()
+    await bot.post_init(application)
+    # Same client object (the prefetcher holds a reference), pointed at the mock
+    client = application.bot_data["adsgram"]
+    await client.close()
+    client.transport = httpx.MockTransport(adsgram)
+    await client.start()
+
+    funnel = Funnel(application, telegram, args.think, args.seed)
+    lag = LoopLagMonitor()
+    active = asyncio.Semaphore(args.concurrency)
+
+    async def simulated_user(user_id: int):
+        async with active:
+            await funnel.user(user_id)
+
+    try:
+        # Warm-up so imports, caches and pools don't count against the run
+        await asyncio.gather(*(simulated_user(1 + i) for i in range(min(100, args.users))))
+        for values in funnel.latencies.values():
+            values.clear()
+        funnel.updates = 0
+
+        lag.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(simulated_user(1000000 + i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        await lag.stop()
+        start_ms = [v * 1000 for v in funnel.latencies["start"]]
+        show_ms = [v * 1000 for v in funnel.latencies["show_ads"]]
+
+        # Separate, smaller pass for allocations: tracemalloc slows everything down
+        alloc_users = min(args.users, args.alloc_users)
+        tracemalloc.start()
+        blocks_before = sys.getallocatedblocks()
+        traced_before, _ = tracemalloc.get_traced_memory()
+        updates_before = funnel.updates
+        await asyncio.gather(*(simulated_user(5000000 + i) for i in range(alloc_users)))
+        traced_after, traced_peak = tracemalloc.get_traced_memory()
+        blocks_after = sys.getallocatedblocks()
+        tracemalloc.stop()
+        alloc_updates = max(1, funnel.updates - updates_before)
+    finally:
+        await bot.post_shutdown(application)
+        await application.shutdown()
+        if SCRATCH_EVENTS_DIR is not None:
+            shutil.rmtree(SCRATCH_EVENTS_DIR, ignore_errors=True)
+
+    lag_ms = [v * 1000 for v in lag.samples]
+    total_updates = len(start_ms) + len(show_ms)
+    return {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "updates": total_updates,
+        "updates_per_second": round(total_updates / elapsed, 1),
+        "start_p50_ms": round(percentile(start_ms, 0.50), 3),
+        "start_p99_ms": round(percentile(start_ms, 0.99), 3),
+        "show_ads_p50_ms": round(percentile(show_ms, 0.50), 3),
+        "show_ads_p99_ms": round(percentile(show_ms, 0.99), 3),
+        "start_histogram_ms": histogram(start_ms),
+        "show_ads_histogram_ms": histogram(show_ms),
+        "loop_lag_p50_ms": round(percentile(lag_ms, 0.50), 3),
+        "loop_lag_p99_ms": round(percentile(lag_ms, 0.99), 3),
+        "loop_lag_max_ms": round(max(lag_ms, default=0.0), 3),
+        "retained_bytes_per_update": round((traced_after - traced_before) / alloc_updates, 1),
+        "peak_traced_bytes_per_update": round((traced_peak - traced_before) / alloc_updates, 1),
+        "net_blocks_per_update": round((blocks_after - blocks_before) / alloc_updates, 2),
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for name, higher_is_better in COMPARED.items():
+        if name not in baseline or name not in result:
+            continue
+        old, new = baseline[name], result[name]
+        if old <= 0:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        marker = "REGRESSION" if worse > tolerance else "ok"
+        print(f"{name:28} {old:>12} -> {new:>12} ({change:+.1%}) {marker}")
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /start -> show_ads funnel in-process")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--think", type=float, default=0.0, help="mean think time between /start and tap")
+    parser.add_argument("--adsgram-latency", default="fixed:0.02")
+    parser.add_argument("--telegram-latency", default="fixed:0")
+    parser.add_argument("--fill-rate", type=float, default=0.9)
+    parser.add_argument("--alloc-users", type=int, default=200, help="users in the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON result to this file")
+    parser.add_argument("--baseline", help="compare against this stored result")
+    parser.add_argument("--save-baseline", help="store this result as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    # bot.py configures INFO logging on import; per-request log lines would dominate the profile
+    logging.getLogger().setLevel(logging.WARNING)
+    result = asyncio.run(run(args))
+    text = json.dumps(result, indent=2)
+    print(text)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Memory and speed of per-user state: UserStateTable versus user_data-style dicts.
+
+Fills a UserStateTable with N users the way start and button_handler do
+(one start and one ad click each), then reports bytes per user measured
+with tracemalloc, lookup and update rates and the longest single insert
+(a shard doubling). The dict baseline is measured on a smaller sample and
+reported per user.
+
+    python -m tools.bench_userstate --users 5000000
+    python -m tools.bench_userstate --users 5000000 --output result.json
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from userstate import UserStateTable
+
+# Telegram user ids are sparse positive integers in roughly this range
+ID_RANGE = (10_000_000, 8_000_000_000)
+
+
+def user_ids(count: int, seed: int):
+    rng = random.Random(seed)
+    return [rng.randrange(*ID_RANGE) for _ in range(count)]
+
+
+def traced_bytes(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def fill_table(ids):
+    table = UserStateTable()
+    now = int(time.time())
+    worst = 0.0
+    for telegram_id in ids:
+        started = time.perf_counter()
+        table.incr(telegram_id, "starts")
+        table.set(telegram_id, "last_start", now)
+        worst = max(worst, time.perf_counter() - started)
+        table.incr(telegram_id, "clicks")
+        table.set(telegram_id, "last_ad", now)
+    return table, worst
+
+
+def fill_dicts(ids):
+    # What user_data would hold: one dict per user with the same four fields
+    now = int(time.time())
+    user_data = {}
+    for telegram_id in ids:
+        data = user_data.setdefault(telegram_id, {})
+        data["starts"] = data.get("starts", 0) + 1
+        data["last_start"] = now
+        data["clicks"] = data.get("clicks", 0) + 1
+        data["last_ad"] = now
+    return user_data
+
+
+def run(args) -> dict:
+    ids = user_ids(args.users, args.seed)
+
+    # tracemalloc slows the fill several times over, so time a separate untraced pass
+    (table, _), table_bytes, _ = traced_bytes(lambda: fill_table(ids))
+    del table
+    gc.collect()
+    started = time.perf_counter()
+    table, worst_insert = fill_table(ids)
+    fill_seconds = time.perf_counter() - started
+
+    sample = ids[: args.lookups]
+    started = time.perf_counter()
+    for telegram_id in sample:
+        table.get(telegram_id, "clicks")
+    lookup_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for telegram_id in sample:
+        table.incr(telegram_id, "clicks")
+    update_seconds = time.perf_counter() - started
+    assert all(table.get(telegram_id, "clicks") >= 2 for telegram_id in sample[:1000])
+
+    dict_ids = ids[: args.dict_users]
+    _, dict_bytes, _ = traced_bytes(lambda: fill_dicts(dict_ids))
+
+    users = len(table)
+    return {
+        "users": users,
+        "table_bytes_per_user": round(table_bytes / users, 1),
+        "table_array_bytes_per_user": round(table.nbytes() / users, 1),
+        "dict_bytes_per_user": round(dict_bytes / len(set(dict_ids)), 1),
+        "fill_seconds": round(fill_seconds, 2),
+        "lookups_per_second": round(len(sample) / lookup_seconds),
+        "updates_per_second": round(len(sample) / update_seconds),
+        "worst_insert_ms": round(worst_insert * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compact per-user state table")
+    parser.add_argument("--users", type=int, default=5_000_000)
+    parser.add_argument("--lookups", type=int, default=1_000_000)
+    parser.add_argument("--dict-users", type=int, default=200_000, help="users in the user_data-style baseline")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON result to this file")
+    args = parser.parse_args()
+
+    text = json.dumps(run(args), indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""End-to-end throughput benchmark: real bot process against local fakes.
+
+Starts tools/fake_adsgram.py and tools/fake_telegram.py in this process,
+launches bot.py as a subprocess pointed at them, then simulates users who
+send /start, think, and tap "Show Ads". Reports updates/s, click-to-edit
+latency percentiles and the bot's RSS growth per 10k active users:
+
+    python -m tools.e2e_bench --users 10000 --concurrency 500 --mode polling
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from http_server import HTTPServer
+from tools.fake_adsgram import Behavior, FakeAdsGram
+from tools.fake_telegram import FakeTelegram
+
+logger = logging.getLogger("e2e_bench")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_bytes(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Harness:
+    def __init__(self, telegram: FakeTelegram, timeout: float):
+        self.telegram = telegram
+        self.timeout = timeout
+        self._replies: Dict[int, asyncio.Future] = {}
+        self._edits: Dict[int, asyncio.Future] = {}
+        self.latencies: List[float] = []
+        self.failures = 0
+        telegram.listeners.append(self._on_bot_call)
+
+    def _on_bot_call(self, method: str, params: dict, result):
+        if method == "sendMessage":
+            future = self._replies.pop(int(params["chat_id"]), None)
+        elif method == "editMessageText":
+            future = self._edits.pop(int(params["chat_id"]), None)
+        else:
+            return
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    async def user(self, user_id: int, think: float):
+        loop = asyncio.get_running_loop()
+        try:
+            reply = self._replies[user_id] = loop.create_future()
+            await self.telegram.push_message(user_id, "/start")
+            message = await asyncio.wait_for(reply, self.timeout)
+
+            await asyncio.sleep(think)
+
+            edit = self._edits[user_id] = loop.create_future()
+            clicked = time.perf_counter()
+            await self.telegram.push_callback(user_id, message, "show_ads")
+            await asyncio.wait_for(edit, self.timeout)
+            self.latencies.append(time.perf_counter() - clicked)
+        except asyncio.TimeoutError:
+            self.failures += 1
+            self._replies.pop(user_id, None)
+            self._edits.pop(user_id, None)
+
+
+async def wait_until(condition, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for {what}")
+        await asyncio.sleep(0.05)
+
+
+async def run(args) -> dict:
+    token = "123456:e2e-bench"
+    telegram = FakeTelegram(token, latency=args.telegram_latency, rate_429=args.telegram_429_rate)
+    adsgram = FakeAdsGram(Behavior(latency=args.adsgram_latency, fill_rate=args.fill_rate))
+
+    telegram_server = HTTPServer("127.0.0.1", 0)
+    telegram.install(telegram_server)
+    adsgram_server = HTTPServer("127.0.0.1", 0)
+    adsgram.install(adsgram_server, ["e2e"])
+    await telegram_server.start()
+    await adsgram_server.start()
+
+    env = dict(
+        os.environ,
+        BOT_TOKEN=token,
+        BLOCK_ID="e2e",
+        BOT_MODE=args.mode,
+        PORT=str(args.bot_port),
+        METRICS_PORT="0",
+        WEBHOOK_URL=f"http://127.0.0.1:{args.bot_port}",
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{telegram_server.port}/bot",
+        ADSGRAM_BASE_URL=f"http://127.0.0.1:{adsgram_server.port}/api",
+        # Benchmark the bot, not Telegram's real flood limits
+        TELEGRAM_GLOBAL_RATE=str(args.telegram_global_rate),
+        TELEGRAM_CHAT_RATE="1000",
+    )
+    # The bot runs from the repo root; keep what it writes there in a scratch directory removed afterwards
+    scratch = tempfile.mkdtemp(prefix="e2e-bench-")
+    for name, default in (("USERS_DB", "users.db"), ("EVENTS_DIR", "events"), ("PROFILE_DIR", "profiles")):
+        env.setdefault(name, os.path.join(scratch, default))
+    log = open(args.bot_log, "w") if args.bot_log else subprocess.DEVNULL
+    bot = subprocess.Popen([sys.executable, "bot.py"], cwd=ROOT, env=env, stdout=log, stderr=log)
+    try:
+        if args.mode == "webhook":
+            await wait_until(lambda: telegram.webhook_url is not None, 30, "setWebhook")
+        else:
+            await wait_until(lambda: telegram.calls["getUpdates"] > 0, 30, "getUpdates")
+        rss_before = rss_bytes(bot.pid)
+
+        harness = Harness(telegram, args.timeout)
+        active = asyncio.Semaphore(args.concurrency)
+
+        async def simulated_user(user_id: int):
+            async with active:
+                await harness.user(user_id, args.think)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(simulated_user(100000 + i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        rss_after = rss_bytes(bot.pid)
+    finally:
+        bot.send_signal(signal.SIGTERM)
+        try:
+            # The bot still talks to the fakes while shutting down, so keep the loop free
+            await asyncio.to_thread(bot.wait, 15)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        await telegram.close()
+        await telegram_server.stop()
+        await adsgram_server.stop()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    completed = len(harness.latencies)
+    return {
+        "mode": args.mode,
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "completed": completed,
+        "failures": harness.failures,
+        "elapsed_seconds": round(elapsed, 3),
+        "updates_per_second": round(2 * completed / elapsed, 1),
+        "click_to_edit_p50_ms": round(percentile(harness.latencies, 0.50) * 1000, 2),
+        "click_to_edit_p99_ms": round(percentile(harness.latencies, 0.99) * 1000, 2),
+        "rss_before_mb": round(rss_before / 2**20, 1),
+        "rss_after_mb": round(rss_after / 2**20, 1),
+        "rss_per_10k_users_mb": round((rss_after - rss_before) / max(1, args.users) * 10000 / 2**20, 2),
+        "telegram_calls": dict(telegram.calls),
+        "telegram_429s": dict(telegram.throttled),
+        "adsgram_responses": dict(adsgram.stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end bot benchmark against local fakes")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200, help="simulated users active at once")
+    parser.add_argument("--think", type=float, default=0.2, help="seconds between /start reply and tap")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--bot-port", type=int, default=8089)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--telegram-latency", default="fixed:0")
+    parser.add_argument("--telegram-429-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-global-rate", type=float, default=100000)
+    parser.add_argument("--adsgram-latency", default="fixed:0.02")
+    parser.add_argument("--fill-rate", type=float, default=0.9)
+    parser.add_argument("--bot-log", help="write the bot's output to this file")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Scriptable local stand-in for the AdsGram API.
+
+Serves GET /api/blocks/{block_id}/start?telegram_id=... with configurable
+latency, fill rate, HTTP errors, slow-loris bodies and malformed JSON, so
+the bot can be benchmarked and soak-tested offline:
+
+    python -m tools.fake_adsgram --port 9000 --latency lognormal:0.08:0.5 --fill-rate 0.7
+    ADSGRAM_BASE_URL=http://127.0.0.1:9000/api python bot.py
+
+A scenario file (JSON list of phases, each {"duration": seconds, ...settings})
+replays behaviour changes over time, and POST /_control with a JSON object
+changes settings on the fly. GET /_stats returns response counts.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+from collections import Counter
+from dataclasses import asdict, dataclass, field, fields
+from http import HTTPStatus
+from typing import List
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger("fake_adsgram")
+
+
+@dataclass
+class Behavior:
+    latency: str = "fixed:0.05"
+    fill_rate: float = 0.8
+    error_rate: float = 0.0
+    error_codes: List[int] = field(default_factory=lambda: [500, 502, 503])
+    malformed_rate: float = 0.0
+    slowloris_rate: float = 0.0
+    slowloris_seconds: float = 30.0
+
+    def update(self, settings: dict):
+        names = {f.name for f in fields(self)}
+        for name, value in settings.items():
+            if name in names:
+                setattr(self, name, value)
+
+
+def sample_latency(spec: str, rng: random.Random) -> float:
+    """Draw a delay from "fixed:s", "uniform:lo:hi", "normal:mean:std",
+    "lognormal:median:sigma" or "exponential:mean"."""
+    kind, *params = spec.split(":")
+    p = [float(x) for x in params]
+    if kind == "fixed":
+        return p[0]
+    if kind == "uniform":
+        return rng.uniform(p[0], p[1])
+    if kind == "normal":
+        return max(0.0, rng.gauss(p[0], p[1]))
+    if kind == "lognormal":
+        return p[0] * rng.lognormvariate(0.0, p[1])
+    if kind == "exponential":
+        return rng.expovariate(1.0 / p[0])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+class FakeAdsGram:
+    def __init__(self, behavior: Behavior, *, seed: int = None):
+        self.behavior = behavior
+        self.rng = random.Random(seed)
+        self.stats = Counter()
+
+    def install(self, server: HTTPServer, block_ids: List[str]):
+        for block_id in block_ids:
+            server.route("GET", f"/api/blocks/{block_id}/start", self.start_ad)
+        server.route("POST", "/_control", self.control)
+        server.route("GET", "/_stats", self.report)
+
+    async def start_ad(self, request: Request) -> Response:
+        b = self.behavior
+        rng = self.rng
+        delay = sample_latency(b.latency, rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        telegram_id = request.query.get("telegram_id", ["0"])[0]
+        roll = rng.random()
+        if roll < b.error_rate:
+            self.stats["error"] += 1
+            return Response(rng.choice(b.error_codes), b'{"error":"fake upstream failure"}', "application/json")
+        roll -= b.error_rate
+        if roll < b.malformed_rate:
+            self.stats["malformed"] += 1
+            return Response(200, b'{"url": "https://example.invalid/', "application/json")
+        roll -= b.malformed_rate
+
+        if rng.random() < b.fill_rate:
+            self.stats["filled"] += 1
+            body = json.dumps({"url": f"https://example.invalid/ad?telegram_id={telegram_id}"}).encode()
+        else:
+            self.stats["no_fill"] += 1
+            body = b"{}"
+
+        if roll < b.slowloris_rate:
+            self.stats["slowloris"] += 1
+            return self._slowloris(body, b.slowloris_seconds)
+        return Response(200, body, "application/json")
+
+    def _slowloris(self, body: bytes, seconds: float) -> Response:
+        # Headers go out at once, then the body trickles out over ``seconds``
+        async def trickle():
+            pause = seconds / max(1, len(body))
+            for i in range(len(body)):
+                yield body[i : i + 1]
+                await asyncio.sleep(pause)
+
+        return Response(200, content_type="application/json", headers={"Content-Length": str(len(body))}, stream=trickle)
+
+    async def control(self, request: Request) -> Response:
+        try:
+            self.behavior.update(json.loads(request.body))
+        except (ValueError, AttributeError) as e:
+            return Response(HTTPStatus.BAD_REQUEST, str(e).encode())
+        logger.info("Behavior changed: %s", self.behavior)
+        return Response(200, json.dumps(asdict(self.behavior)).encode(), "application/json")
+
+    async def report(self, request: Request) -> Response:
+        return Response(200, json.dumps(dict(self.stats)).encode(), "application/json")
+
+    async def run_scenario(self, phases: List[dict]):
+        for phase in phases:
+            self.behavior.update(phase)
+            logger.info("Scenario phase for %ss: %s", phase.get("duration", 0), self.behavior)
+            await asyncio.sleep(float(phase.get("duration", 0)))
+
+
+async def serve(args):
+    behavior = Behavior(
+        latency=args.latency,
+        fill_rate=args.fill_rate,
+        error_rate=args.error_rate,
+        error_codes=[int(c) for c in args.error_codes.split(",")],
+        malformed_rate=args.malformed_rate,
+        slowloris_rate=args.slowloris_rate,
+        slowloris_seconds=args.slowloris_seconds,
+    )
+    fake = FakeAdsGram(behavior, seed=args.seed)
+    server = HTTPServer(args.host, args.port)
+    fake.install(server, args.blocks.split(","))
+    await server.start()
+    try:
+        if args.scenario:
+            with open(args.scenario) as f:
+                await fake.run_scenario(json.load(f))
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake AdsGram API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--blocks", default="1", help="comma-separated block ids to serve")
+    parser.add_argument("--latency", default="fixed:0.05", help="latency distribution, e.g. lognormal:0.08:0.5")
+    parser.add_argument("--fill-rate", type=float, default=0.8)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-codes", default="500,502,503")
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--slowloris-rate", type=float, default=0.0)
+    parser.add_argument("--slowloris-seconds", type=float, default=30.0)
+    parser.add_argument("--scenario", help="JSON file with a list of timed behavior phases")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
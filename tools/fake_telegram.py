@@ -0,0 +1,283 @@
+"""Local stand-in for the Telegram Bot API.
+
+Implements the handful of methods the bot uses (getMe, getUpdates,
+setWebhook/deleteWebhook, sendMessage, answerCallbackQuery,
+editMessageText) with injectable latency and 429 responses. Updates are
+handed out through getUpdates long polling, or POSTed to the bot's
+webhook once it has called setWebhook. Point the bot at it with
+
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:9001/bot python bot.py
+
+tools/e2e_bench.py drives it with simulated users.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+from http import HTTPStatus
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+import httpx
+
+from http_server import HTTPServer, Request, Response
+from tools.fake_adsgram import sample_latency
+
+logger = logging.getLogger("fake_telegram")
+
+BOT_USER = {"id": 1000000, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+METHODS = (
+    "getMe",
+    "getUpdates",
+    "setWebhook",
+    "deleteWebhook",
+    "getWebhookInfo",
+    "sendMessage",
+    "answerCallbackQuery",
+    "editMessageText",
+    "close",
+    "logOut",
+)
+
+
+def parse_params(request: Request) -> dict:
+    if not request.body:
+        return {}
+    if request.headers.get("content-type", "").startswith("application/json"):
+        return json.loads(request.body)
+    # python-telegram-bot sends form fields whose values are JSON encoded (except plain strings)
+    params = {}
+    for name, values in parse_qs(request.body.decode()).items():
+        try:
+            params[name] = json.loads(values[0])
+        except ValueError:
+            params[name] = values[0]
+    return params
+
+
+class FakeTelegram:
+    def __init__(
+        self,
+        token: str,
+        *,
+        latency: str = "fixed:0",
+        rate_429: float = 0.0,
+        retry_after: int = 1,
+        seed: int = None,
+    ):
+        self.token = token
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.throttled = Counter()
+
+        self._updates: List[dict] = []
+        self._update_event = asyncio.Event()
+        self._next_update_id = 1
+        self._next_message_id: Dict[int, int] = defaultdict(int)
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self._webhook_client: Optional[httpx.AsyncClient] = None
+        # Called with (method, params, result) after every successful bot call
+        self.listeners: List[Callable[[str, dict, object], None]] = []
+
+    def install(self, server: HTTPServer):
+        for method in METHODS:
+            server.route("POST", f"/bot{self.token}/{method}", self._endpoint(method))
+
+    async def close(self):
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+
+    # Update injection
+
+    def new_user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "language_code": "en"}
+
+    async def push_message(self, user_id: int, text: str) -> int:
+        user = self.new_user(user_id)
+        message = {
+            "message_id": self._message_id(user_id),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return await self._push({"message": message})
+
+    async def push_callback(self, user_id: int, message: dict, data: str) -> int:
+        callback = {
+            "id": f"{user_id}-{message['message_id']}-{self._next_update_id}",
+            "from": self.new_user(user_id),
+            "message": message,
+            "chat_instance": str(user_id),
+            "data": data,
+        }
+        return await self._push({"callback_query": callback})
+
+    async def _push(self, update: dict) -> int:
+        update["update_id"] = self._next_update_id
+        self._next_update_id += 1
+        if self.webhook_url:
+            await self._deliver(update)
+        else:
+            self._updates.append(update)
+            self._update_event.set()
+        return update["update_id"]
+
+    async def _deliver(self, update: dict):
+        if self._webhook_client is None:
+            self._webhook_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=100))
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret or ""}
+        try:
+            await self._webhook_client.post(self.webhook_url, json=update, headers=headers)
+        except httpx.HTTPError as e:
+            logger.error("Webhook delivery failed: %s", e)
+
+    def _message_id(self, chat_id: int) -> int:
+        self._next_message_id[chat_id] += 1
+        return self._next_message_id[chat_id]
+
+    # Bot API methods
+
+    def _endpoint(self, method: str):
+        async def handle(request: Request) -> Response:
+            self.calls[method] += 1
+            delay = sample_latency(self.latency, self.rng)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if method not in ("getUpdates", "getMe") and self.rng.random() < self.rate_429:
+                self.throttled[method] += 1
+                return self._reply(
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {self.retry_after}",
+                        "parameters": {"retry_after": self.retry_after},
+                    },
+                    HTTPStatus.TOO_MANY_REQUESTS,
+                )
+
+            params = parse_params(request)
+            result = await getattr(self, f"_{method}")(params)
+            if isinstance(result, Response):
+                return result
+            for listener in self.listeners:
+                listener(method, params, result)
+            return self._reply({"ok": True, "result": result})
+
+        return handle
+
+    def _reply(self, payload: dict, status: int = 200) -> Response:
+        return Response(status, json.dumps(payload).encode(), "application/json")
+
+    async def _getMe(self, params):
+        return BOT_USER
+
+    async def _getUpdates(self, params):
+        if self.webhook_url:
+            return self._reply(
+                {"ok": False, "error_code": 409, "description": "Conflict: can't use getUpdates while webhook is active"},
+                HTTPStatus.CONFLICT,
+            )
+        offset = int(params.get("offset") or 0)
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._update_event.clear()
+            try:
+                await asyncio.wait_for(self._update_event.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return self._updates[:limit]
+
+    async def _setWebhook(self, params):
+        self.webhook_url = params["url"]
+        self.webhook_secret = params.get("secret_token")
+        logger.info("Webhook set to %s", self.webhook_url)
+        return True
+
+    async def _deleteWebhook(self, params):
+        self.webhook_url = None
+        self.webhook_secret = None
+        return True
+
+    async def _getWebhookInfo(self, params):
+        return {"url": self.webhook_url or "", "has_custom_certificate": False, "pending_update_count": len(self._updates)}
+
+    async def _sendMessage(self, params):
+        chat_id = int(params["chat_id"])
+        message = {
+            "message_id": self._message_id(chat_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+        if "reply_markup" in params:
+            message["reply_markup"] = params["reply_markup"]
+        return message
+
+    async def _answerCallbackQuery(self, params):
+        return True
+
+    async def _editMessageText(self, params):
+        chat_id = int(params["chat_id"])
+        return {
+            "message_id": int(params["message_id"]),
+            "date": int(time.time()),
+            "edit_date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    async def _close(self, params):
+        return True
+
+    async def _logOut(self, params):
+        return True
+
+
+async def serve(args):
+    fake = FakeTelegram(args.token, latency=args.latency, rate_429=args.rate_429, retry_after=args.retry_after)
+    server = HTTPServer(args.host, args.port)
+    fake.install(server)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        await fake.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--token", default="123456:fake")
+    parser.add_argument("--latency", default="fixed:0", help="latency distribution, e.g. lognormal:0.03:0.4")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import List, Optional
+
+import httpx
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+TRACE_SPANS = Counter(
+    "trace_spans_total",
+    "Finished spans by fate (exported, dropped when the exporter queue was full)",
+    ("result",),
+)
+
+# Zipkin span kinds
+CLIENT = "CLIENT"
+SERVER = "SERVER"
+CONSUMER = "CONSUMER"
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace.trace_id if span is not None else None
+
+
+class _Trace:
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = os.urandom(16).hex()
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "tags", "start", "duration", "_started", "_token")
+
+    def __init__(self, trace: _Trace, parent_id: Optional[str], name: str, kind: Optional[str], tags: dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.tags = tags
+        self.start = time.time()
+        self.duration = 0.0
+        self._started = time.perf_counter()
+        self._token = None
+
+    def set_tag(self, key: str, value):
+        self.tags[key] = value
+
+    def to_zipkin(self, service: str) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": int(self.start * 1_000_000),
+            "duration": max(1, int(self.duration * 1_000_000)),
+            "localEndpoint": {"serviceName": service},
+            "tags": {k: str(v) for k, v in self.tags.items()},
+        }
+        if self.parent_id is not None:
+            span["parentId"] = self.parent_id
+        if self.kind is not None:
+            span["kind"] = self.kind
+        return span
+
+
+class _NoopScope:
+    """Returned when nothing is being traced; costs one attribute lookup per use."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopScope()
+
+
+class _SpanScope:
+    __slots__ = ("tracer", "span")
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.span._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.duration = time.perf_counter() - span._started
+        if exc is not None and not isinstance(exc, asyncio.CancelledError):
+            span.tags["error"] = type(exc).__name__
+        _current.reset(span._token)
+        self.tracer._finish(span)
+        return False
+
+
+class Tracer:
+    """Per-update traces with child spans for outbound calls, exported in the Zipkin v2 format.
+
+    A trace is kept when it is head-sampled (``sample_rate``) or when its root
+    span took at least ``slow_threshold`` seconds, so the rare slow click is
+    captured without exporting every update. Without an exporter, or with both
+    knobs at zero, every call returns a shared no-op scope.
+    """
+
+    def __init__(
+        self,
+        exporter=None,
+        *,
+        service: str = "ads-bot",
+        sample_rate: float = 0.0,
+        slow_threshold: float = 0.0,
+        max_spans: int = 64,
+    ):
+        self.exporter = exporter
+        self.service = service
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.max_spans = max_spans
+        self.enabled = exporter is not None and (sample_rate > 0 or slow_threshold > 0)
+
+    def trace(self, name: str, kind: Optional[str] = CONSUMER, **tags):
+        """Start a new trace rooted at ``name``."""
+        if not self.enabled:
+            return _NOOP
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_threshold <= 0:
+            return _NOOP
+        return _SpanScope(self, Span(_Trace(sampled), None, name, kind, tags))
+
+    def span(self, name: str, kind: Optional[str] = None, **tags):
+        """Start a child of the current span; a no-op outside a trace."""
+        parent = _current.get()
+        if parent is None:
+            return _NOOP
+        trace = parent.trace
+        if len(trace.spans) >= self.max_spans:
+            return _NOOP
+        return _SpanScope(self, Span(trace, parent.span_id, name, kind, tags))
+
+    def _finish(self, span: Span):
+        trace = span.trace
+        trace.spans.append(span)
+        if span.parent_id is not None:
+            return
+        if trace.sampled or span.duration >= self.slow_threshold > 0:
+            if not trace.sampled:
+                span.tags["slow"] = True
+            self.exporter.export([s.to_zipkin(self.service) for s in trace.spans])
+
+
+class FileExporter:
+    """Appends spans as JSON lines (one Zipkin v2 span per line) from a writer thread."""
+
+    def __init__(self, path: str, queue_size: int = 10000):
+        self.path = path
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._exported = TRACE_SPANS.labels("exported")
+        self._dropped = TRACE_SPANS.labels("dropped")
+
+    async def start(self):
+        self._thread.start()
+        logger.info("Writing traces to %s", self.path)
+
+    async def close(self):
+        self._queue.put(None)
+        await asyncio.to_thread(self._thread.join)
+
+    def export(self, spans: List[dict]):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self._dropped.inc(len(spans))
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                spans = self._queue.get()
+                if spans is None:
+                    return
+                for span in spans:
+                    f.write(json.dumps(span, separators=(",", ":")))
+                    f.write("\n")
+                self._exported.inc(len(spans))
+                if self._queue.empty():
+                    f.flush()
+
+
+class ZipkinExporter:
+    """Batches spans and POSTs them to a Zipkin-compatible collector (``/api/v2/spans``)."""
+
+    def __init__(self, url: str, *, flush_interval: float = 1.0, max_buffer: int = 10000):
+        self.url = url
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[dict] = []
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._exported = TRACE_SPANS.labels("exported")
+        self._dropped = TRACE_SPANS.labels("dropped")
+
+    async def start(self):
+        self._client = httpx.AsyncClient(timeout=5.0)
+        self._task = asyncio.create_task(self._run())
+        logger.info("Sending traces to %s", self.url)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def export(self, spans: List[dict]):
+        if len(self._buffer) + len(spans) > self.max_buffer:
+            self._dropped.inc(len(spans))
+            return
+        self._buffer.extend(spans)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+
+    async def _flush(self):
+        if not self._buffer or self._client is None:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            response = await self._client.post(self.url, json=batch)
+            response.raise_for_status()
+            self._exported.inc(len(batch))
+        except httpx.HTTPError as e:
+            self._dropped.inc(len(batch))
+            logger.warning("Failed to send %d spans to %s: %s", len(batch), self.url, e)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def trace(name: str, kind: Optional[str] = CONSUMER, **tags):
+    return _tracer.trace(name, kind, **tags)
+
+
+def span(name: str, kind: Optional[str] = None, **tags):
+    return _tracer.span(name, kind, **tags)
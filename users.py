@@ -0,0 +1,160 @@
+import asyncio
+import contextlib
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+USERS_RECORDED = Counter("user_registry_records_total", "User sightings by result (buffered, dropped)", ("result",))
+USERS_WRITTEN = Counter("user_registry_rows_written_total", "User rows upserted into SQLite")
+USERS_PENDING = Gauge("user_registry_pending", "Distinct users waiting in the write-behind buffer")
+FLUSH_SECONDS = Histogram("user_registry_flush_duration_seconds", "Time to write one batch to SQLite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    telegram_id INTEGER PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    language TEXT
+)
+"""
+
+_UPSERT = """
+INSERT INTO users (telegram_id, first_seen, last_seen, language) VALUES (?, ?, ?, ?)
+ON CONFLICT (telegram_id) DO UPDATE SET
+    first_seen = min(first_seen, excluded.first_seen),
+    last_seen = max(last_seen, excluded.last_seen),
+    language = coalesce(excluded.language, language)
+"""
+
+
+class UserRegistry:
+    """Remembers every user who talks to the bot, in an SQLite database in WAL mode.
+
+    ``record`` only touches an in-memory dict keyed by user, so repeated
+    sightings between flushes collapse into one row and the handler never
+    waits on disk. A background task writes the buffer every
+    ``flush_interval`` seconds (sooner once ``flush_size`` users are pending)
+    in one transaction on a worker thread. When the database falls behind and
+    ``max_pending`` users are waiting, new users are dropped rather than
+    growing memory; users already pending still get their last_seen updated.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        flush_interval: float = 5.0,
+        flush_size: int = 5000,
+        max_pending: int = 100000,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_pending = max_pending
+        # telegram_id -> [first_seen, last_seen, language]
+        self._pending: Dict[int, list] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        # One writer at a time; the connection is shared by executor threads
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._buffered = USERS_RECORDED.labels("buffered")
+        self._dropped = USERS_RECORDED.labels("dropped")
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def start(self):
+        self._db = await asyncio.to_thread(self._open)
+        self._task = asyncio.create_task(self._run())
+        logger.info("User registry at %s", self.path)
+
+    async def close(self):
+        if self._task is not None:
+            # Let a write in progress finish rather than cancelling it mid-transaction
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        if self._db is not None:
+            await self.flush()
+            db, self._db = self._db, None
+            await asyncio.to_thread(db.close)
+
+    def record(self, telegram_id: int, language: Optional[str] = None):
+        now = time.time()
+        entry = self._pending.get(telegram_id)
+        if entry is not None:
+            entry[1] = now
+            if language:
+                entry[2] = language
+        elif len(self._pending) >= self.max_pending:
+            self._dropped.inc()
+            return
+        else:
+            self._pending[telegram_id] = [now, now, language or None]
+            if len(self._pending) >= self.flush_size:
+                self._wake.set()
+        self._buffered.inc()
+
+    async def flush(self):
+        if not self._pending or self._db is None:
+            return
+        async with self._lock:
+            batch, self._pending = self._pending, {}
+            rows = [(telegram_id, *entry) for telegram_id, entry in batch.items()]
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except sqlite3.Error as e:
+                logger.error("Failed to write %d users to %s: %s", len(rows), self.path, e)
+                self._requeue(batch)
+                return
+            finally:
+                FLUSH_SECONDS.observe(time.perf_counter() - started)
+            USERS_WRITTEN.inc(len(rows))
+
+    async def _run(self):
+        while not self._closing:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            self._wake.clear()
+            USERS_PENDING.set(len(self._pending))
+            await self.flush()
+
+    def _requeue(self, batch: Dict[int, list]):
+        # Sightings recorded during the failed write are newer; merge the old ones under them
+        for telegram_id, (first_seen, last_seen, language) in batch.items():
+            entry = self._pending.get(telegram_id)
+            if entry is None:
+                if len(self._pending) >= self.max_pending:
+                    self._dropped.inc()
+                    continue
+                self._pending[telegram_id] = [first_seen, last_seen, language]
+            else:
+                entry[0] = min(entry[0], first_seen)
+                entry[2] = entry[2] or language
+
+    def _open(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL only risks the last transactions on power loss, never corruption
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(_SCHEMA)
+        return db
+
+    def _write(self, rows: List[tuple]):
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            db.executemany(_UPSERT, rows)
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
@@ -0,0 +1,130 @@
+from array import array
+from typing import Dict, List, Sequence, Tuple
+
+# (name, array typecode); "I" is uint32, enough for counters and unix seconds until 2106
+DEFAULT_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("starts", "I"),
+    ("clicks", "I"),
+    ("last_start", "I"),
+    ("last_ad", "I"),
+)
+
+_EMPTY = 0  # Telegram user ids are positive
+_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+class _Shard:
+    __slots__ = ("keys", "columns", "used", "mask")
+
+    def __init__(self, capacity: int, typecodes: Sequence[str]):
+        self.keys = array("q", bytes(8 * capacity))
+        self.columns = [array(code, bytes(array(code).itemsize * capacity)) for code in typecodes]
+        self.used = 0
+        self.mask = capacity - 1
+
+
+class UserStateTable:
+    """Fixed-width numeric fields per Telegram user in flat arrays.
+
+    Keys live in int64 arrays and each field in its own typed array (one
+    "column" per field), indexed through open addressing with linear
+    probing, so a user costs the key plus the field widths divided by the
+    load factor instead of a dict per user. The table is split into
+    ``shards`` independent tables by hash; a shard that fills up doubles on
+    its own, so growth never rehashes more than 1/shards of the users in one
+    step and the event loop is not held for seconds at millions of users.
+    Unknown users read as all zeros. There is no delete.
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[Tuple[str, str]] = DEFAULT_FIELDS,
+        *,
+        shards: int = 1024,
+        initial_capacity: int = 64,
+        load_factor: float = 0.75,
+    ):
+        if shards & (shards - 1) or initial_capacity & (initial_capacity - 1):
+            raise ValueError("shards and initial_capacity must be powers of two")
+        self.fields: Dict[str, int] = {name: i for i, (name, _) in enumerate(fields)}
+        self._typecodes = [code for _, code in fields]
+        self.load_factor = load_factor
+        self._shard_mask = shards - 1
+        self._shards: List[_Shard] = [_Shard(initial_capacity, self._typecodes) for _ in range(shards)]
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, telegram_id: int) -> bool:
+        shard, index = self._locate(telegram_id)
+        return shard.keys[index] != _EMPTY
+
+    def get(self, telegram_id: int, field: str) -> int:
+        shard, index = self._locate(telegram_id)
+        if shard.keys[index] == _EMPTY:
+            return 0
+        return shard.columns[self.fields[field]][index]
+
+    def set(self, telegram_id: int, field: str, value: int):
+        shard, index = self._insert(telegram_id)
+        shard.columns[self.fields[field]][index] = value
+
+    def incr(self, telegram_id: int, field: str, amount: int = 1) -> int:
+        shard, index = self._insert(telegram_id)
+        column = shard.columns[self.fields[field]]
+        column[index] += amount
+        return column[index]
+
+    def row(self, telegram_id: int) -> Dict[str, int]:
+        shard, index = self._locate(telegram_id)
+        found = shard.keys[index] != _EMPTY
+        return {name: shard.columns[i][index] if found else 0 for name, i in self.fields.items()}
+
+    def nbytes(self) -> int:
+        """Bytes held by the arrays (keys and fields), excluding per-object overhead."""
+        return sum(
+            shard.keys.itemsize * len(shard.keys) + sum(c.itemsize * len(c) for c in shard.columns)
+            for shard in self._shards
+        )
+
+    def _locate(self, telegram_id: int) -> Tuple[_Shard, int]:
+        """The user's slot, or the empty slot where it would go."""
+        h = (telegram_id * _MULTIPLIER) & _MASK64
+        shard = self._shards[h & self._shard_mask]
+        keys, mask = shard.keys, shard.mask
+        # High bits pick the slot; the low ones already picked the shard
+        index = (h >> 32) & mask
+        while True:
+            key = keys[index]
+            if key == telegram_id or key == _EMPTY:
+                return shard, index
+            index = (index + 1) & mask
+
+    def _insert(self, telegram_id: int) -> Tuple[_Shard, int]:
+        shard, index = self._locate(telegram_id)
+        if shard.keys[index] != _EMPTY:
+            return shard, index
+        if shard.used + 1 > self.load_factor * (shard.mask + 1):
+            self._grow(shard)
+            shard, index = self._locate(telegram_id)
+        shard.keys[index] = telegram_id
+        shard.used += 1
+        self._len += 1
+        return shard, index
+
+    def _grow(self, shard: _Shard):
+        old_keys, old_columns = shard.keys, shard.columns
+        grown = _Shard(2 * len(old_keys), self._typecodes)
+        keys, columns, mask = grown.keys, grown.columns, grown.mask
+        for old_index, key in enumerate(old_keys):
+            if key == _EMPTY:
+                continue
+            index = (((key * _MULTIPLIER) & _MASK64) >> 32) & mask
+            while keys[index] != _EMPTY:
+                index = (index + 1) & mask
+            keys[index] = key
+            for column, old_column in zip(columns, old_columns):
+                column[index] = old_column[old_index]
+        shard.keys, shard.columns, shard.mask = keys, columns, mask
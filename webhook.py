@@ -0,0 +1,107 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from http import HTTPStatus
+from typing import Callable, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def add_webhook_route(
+    server: HTTPServer,
+    application: Application,
+    path: str,
+    secret_token: str,
+    on_delivery: Optional[Callable[[], None]] = None,
+):
+    """Accept Telegram updates on ``path`` and put them straight on the update queue."""
+    expected = secret_token.encode()
+
+    async def receive_update(request: Request) -> Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, "").encode(), expected):
+            logger.warning("Rejected webhook request with a wrong secret token")
+            return Response(HTTPStatus.FORBIDDEN)
+        try:
+            update = Update.de_json(json.loads(request.body), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.error("Invalid update received on webhook: %s", e)
+            return Response(HTTPStatus.BAD_REQUEST)
+
+        await application.update_queue.put(update)
+        if on_delivery is not None:
+            on_delivery()
+        return Response(HTTPStatus.OK)
+
+    server.route("POST", path, receive_update)
+
+
+def run_webhook(
+    application: Application,
+    *,
+    url: str,
+    secret_token: str,
+    max_connections: int = 40,
+    drop_pending_updates: bool = False,
+):
+    """Webhook counterpart of ``Application.run_polling``.
+
+    Runs the same lifecycle (post_init, start, stop, post_stop, shutdown,
+    post_shutdown) but registers the webhook with Telegram after start and
+    removes it again before stopping. The HTTP server that receives updates
+    is started by the caller, typically in post_init.
+    """
+    loop = asyncio.get_event_loop()
+    stopped = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+        try:
+            loop.add_signal_handler(sig, stopped.set)
+        except NotImplementedError:
+            pass
+
+    async def set_webhook():
+        await application.bot.set_webhook(
+            url=url,
+            secret_token=secret_token,
+            max_connections=max_connections,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=drop_pending_updates,
+        )
+        logger.info("Webhook registered at %s", url)
+
+    async def delete_webhook():
+        try:
+            await application.bot.delete_webhook()
+            logger.info("Webhook removed")
+        except Exception as e:
+            logger.error("Failed to remove webhook: %s", e)
+
+    try:
+        loop.run_until_complete(application.initialize())
+        if application.post_init:
+            loop.run_until_complete(application.post_init(application))
+        loop.run_until_complete(application.start())
+        loop.run_until_complete(set_webhook())
+        loop.run_until_complete(stopped.wait())
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        try:
+            loop.run_until_complete(delete_webhook())
+            if application.running:
+                loop.run_until_complete(application.stop())
+            if application.post_stop:
+                loop.run_until_complete(application.post_stop(application))
+            loop.run_until_complete(application.shutdown())
+            if application.post_shutdown:
+                loop.run_until_complete(application.post_shutdown(application))
+        finally:
+            loop.close()